@@ -15,6 +15,21 @@ from environ import Env
 START_SHIFT = 5, 0  # начало смены: часы, минуты через запятую, например: 5, 0 == 5:00
 # -------------------------------------------------------------------------------------------------------------------- #
 
+# -------------------------------------------------------------------------------------------------------------------- #
+# Menu settings                                                                                                        #
+# -------------------------------------------------------------------------------------------------------------------- #
+# "album" - альбомы блюд и одна клавиатура под ними, "carousel" - одно сообщение, которое листается кнопками ◀ ▶,
+# "photos" - каждое блюдо с кнопкой отдельно
+MENU_MODE = "album"
+ALBUM_SIZE = 10  # Блюд в одном альбоме, не больше 10
+MENU_ROW_WIDTH = 2  # Кнопок блюд в ряду клавиатуры под альбомами
+CAROUSEL_SNAPSHOTS = 1000  # Сколько последних показанных меню можно листать
+RENDER_CACHE = 1000  # Сколько подписей блюд и клавиатур хранить готовыми
+BOT_RATE = 30  # Сообщений в секунду во все чаты - ограничение Telegram
+BOT_CHAT_RATE = 1, 3  # Сообщений в секунду в один чат, сколько можно отправить сразу - ограничение Telegram
+DELETE_PERIOD = 1  # Секунд, за которые сообщения пользователя собираются для удаления одним запросом
+# -------------------------------------------------------------------------------------------------------------------- #
+
 # -------------------------------------------------------------------------------------------------------------------- #
 # .env variables                                                                                                       #
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -31,9 +46,42 @@ ADMINS = tuple(map(int, env("ADMIN_IDS").split()))
 TERMINAL_KEY = env("TERMINAL_KEY")
 TERMINAL_PASSWORD = env("TERMINAL_PASSWORD")
 INIT_PAYMENT_API = env("TINKOFF_INIT_API")
-INIT_PAYMENT_RETRIES = 3, 5  # Количество попыток, перерыв между запросами (сек) - для получения платежной ссылки
 STATE_PAYMENT_API = env("TINKOFF_STATE_API")
-STATE_PAYMENT_RETRIES = 120  # Перерыв между запросами (сек) - для получения статуса платежа
+# API отмены платежа, например https://securepay.tinkoff.ru/v2/Cancel. Если указан, платеж банка, ссылка на который
+# не отправлена (заказ изменился во время запроса ссылки), отменяется. Без него такой платеж просто истекает в банке
+CANCEL_PAYMENT_API = env("TINKOFF_CANCEL_API", default="")
+OUTBOX_WORKERS = 5  # Одновременных запросов к банку из очереди операций (получение ссылки, отмена)
+OUTBOX_RETRIES = 6  # Количество попыток операции, после последней заказ без ссылки отменяется
+OUTBOX_BACKOFF = 5, 300  # Перерыв после первой попытки, наибольший перерыв (сек), дальше перерыв удваивается
+STATE_PAYMENT_INTERVALS = 3, 5, 10  # Первые перерывы между запросами статуса нового платежа (сек)
+STATE_PAYMENT_RETRIES = 1800  # Дальше перерыв удваивается, но не больше этого (сек) - для получения статуса платежа
+STATE_PAYMENT_LIFETIME = 24 * 60 * 60  # Неоплаченный платеж считается просроченным спустя (сек)
+STATE_PAYMENT_WORKERS = 20  # Одновременных запросов статуса платежа
+STATE_PAYMENT_TIMEOUT = 10  # Ожидание ответа на запрос статуса платежа (сек), иначе спросим в следующий раз
+# Адрес бота для уведомлений банка о статусе платежа, например https://example.com/notification. Если не указан, статусы
+# только опрашиваются, иначе опрос остается запасным: с перерывами STATE_PAYMENT_FALLBACK вместо STATE_PAYMENT_INTERVALS
+NOTIFICATION_URL = env("TINKOFF_NOTIFICATION_URL", default="")
+# Адрес коротких ссылок на оплату, например https://example.com/l/. Если не указан, отправляется ссылка банка
+SHORT_LINKS_URL = env("SHORT_LINKS_URL", default="")
+SHORT_LINKS_CACHE = 1000  # Сколько последних коротких ссылок держать в памяти
+WEB_SERVER = "0.0.0.0", 8080  # Адрес и порт для уведомлений банка и коротких ссылок (за прокси)
+STATE_PAYMENT_FALLBACK = (300,)  # Первые перерывы между запросами статуса платежа при уведомлениях (сек)
+HTTP_TIMEOUTS = 5, 15  # Ожидание соединения, ожидание ответа (сек) - для запросов к банку
+HTTP_LIMITS = 20, 10  # Всего соединений, из них держать открытыми для повторного использования
+HTTP_RETRIES = 3  # Количество попыток запроса - для получения платежной ссылки
+HTTP_BACKOFF = 0.5, 4  # Перерыв после первой попытки, наибольший перерыв (сек), перерыв выбирается случайно до него
+HTTP_RETRY_BUDGET = 0.2, 10  # Доля повтора на каждый запрос, наибольший запас повторов - общий на все запросы
+HTTP_BREAKER = 5, 30  # Ошибок подряд, после которых сервер не опрашивается, и сколько (сек) - для каждого сервера
+# -------------------------------------------------------------------------------------------------------------------- #
+
+# -------------------------------------------------------------------------------------------------------------------- #
+# Database settings                                                                                                    #
+# -------------------------------------------------------------------------------------------------------------------- #
+DB_READERS = 4  # Количество соединений для чтения (запись всегда идет через одно соединение)
+DB_CACHE_SIZE = 16 * 1024  # Размер кэша страниц для каждого соединения (КиБ)
+DB_MMAP_SIZE = 64 * 1024 * 1024  # Размер отображаемой в память части файла базы (байт)
+DB_BUSY_TIMEOUT = 5000  # Сколько ждать освобождения базы другим соединением (мс)
+USERS_FLUSH_PERIOD = 30  # Как часто сохранять новых пользователей в базу (сек)
 # -------------------------------------------------------------------------------------------------------------------- #
 
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -1,10 +1,35 @@
+import httpx
+
 from aiogram import Bot
+from aiohttp import web
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import Dispatcher
 
 from core import config
+from core.resilience import CircuitBreakers, RetryBudget
+from core.router import CallbackRouter
+from core.sender import DeleteQueue, SendScheduler
+
+try:
+    import h2  # noqa: F401 HTTP/2 is used only if httpx[http2] is installed
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
 storage = MemoryStorage()
 
 bot = Bot(token=config.TOKEN)
 dp = Dispatcher(bot, storage=storage)
+router = CallbackRouter()
+sender = SendScheduler(config.BOT_RATE, *config.BOT_CHAT_RATE)
+deleter = DeleteQueue(bot, sender, config.DELETE_PERIOD)
+web_app = web.Application()
+
+http = httpx.AsyncClient(
+    http2=HTTP2,
+    timeout=httpx.Timeout(config.HTTP_TIMEOUTS[1], connect=config.HTTP_TIMEOUTS[0]),
+    limits=httpx.Limits(max_connections=config.HTTP_LIMITS[0], max_keepalive_connections=config.HTTP_LIMITS[1]),
+)
+breakers = CircuitBreakers(*config.HTTP_BREAKER)
+retry_budget = RetryBudget(*config.HTTP_RETRY_BUDGET)
@@ -1,14 +1,71 @@
-from typing import Union
+import logging
+
+from asyncio import gather
+from functools import partial
+from typing import Iterable, Iterator, List, Union
 
 from aiogram import Bot
 from aiogram.types import Message, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, CallbackQuery
+from aiogram.types import InputMediaPhoto
 from aiogram.utils import exceptions as aiogram_exceptions
-from core.create import bot
+from core.create import bot, deleter, sender
+from core.sender import PRIORITY_MENU, PRIORITY_PAYMENT, PRIORITY_REPLY
 from localization import ru
 
-MARKUPS = Union[ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup]
+MARKUPS = Union[ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, str]  # str is a serialized keyboard
 RESPONSE = Union[Bot, None]
 MESSAGES = Union[Message, CallbackQuery]
+MESSAGE_LIMIT = 4096  # Telegram's limit of the message's length
+MARKDOWN_SPECIALS = "_", "*", "`", "["
+
+
+def escape_markdown(text: str) -> str:
+    """
+    Escapes special characters of the Markdown, e.g. in the product's name inserted into the message
+    :param text: Any text
+    :return: Text shown as is
+    """
+    for special in MARKDOWN_SPECIALS:
+        text = text.replace(special, "\\" + special)
+    return text
+
+
+def pack_lines(lines: Iterable[str], limit: int = MESSAGE_LIMIT) -> Iterator[str]:
+    """
+    Packs lines into the fewest messages not longer than the limit. The line longer than the limit is cut, but not
+    between the backslash and the escaped character
+    :param lines: Lines of the messages, Markdown is already escaped
+    :param limit: The longest message
+    :return: Messages
+    """
+    chunk: List[str] = []
+    length: int = -1
+    for line in lines:
+        while len(line) > limit:
+            cut: int = limit - 1 if line[limit - 1] == "\\" else limit
+            head, line = line[:cut], line[cut:]
+            if chunk:
+                yield "\n".join(chunk)
+                chunk, length = [], -1
+            yield head
+        if length + 1 + len(line) > limit:
+            yield "\n".join(chunk)
+            chunk, length = [], -1
+        chunk.append(line)
+        length += 1 + len(line)
+    if chunk:
+        yield "\n".join(chunk)
+
+
+def delete_later(message: MESSAGES) -> None:
+    """
+    Queues deletion of the message or of the query's message, the deletion doesn't delay the response
+    :param message: Aiogram message object
+    :return: None
+    """
+    if isinstance(message, CallbackQuery):
+        message = message.message
+    deleter.delete(message.chat.id, message.message_id)
 
 
 async def respond(message: MESSAGES, text, markup: MARKUPS = None, del_msg=True) -> RESPONSE:
@@ -21,12 +78,13 @@ async def respond(message: MESSAGES, text, markup: MARKUPS = None, del_msg=True)
     :return: Sent message to the message's author
     """
     try:
-        response = await bot.send_message(message.from_user.id, text, reply_markup=markup, parse_mode="Markdown")
+        response = await sender.send(
+            PRIORITY_REPLY,
+            message.from_user.id,
+            partial(bot.send_message, message.from_user.id, text, reply_markup=markup, parse_mode="Markdown"),
+        )
         if del_msg:
-            if isinstance(message, CallbackQuery):
-                await message.message.delete()
-            else:
-                await message.delete()
+            delete_later(message)
         return response
     except aiogram_exceptions.CantInitiateConversation:
         await message.reply(ru.ERR_NOT_REG)
@@ -34,6 +92,22 @@ async def respond(message: MESSAGES, text, markup: MARKUPS = None, del_msg=True)
         await message.reply(ru.ERR_BLOCKED)
 
 
+async def respond_lines(message: MESSAGES, lines: Iterable[str], markup: MARKUPS = None, del_msg=True) -> None:
+    """
+    Sends multi-line text packed into the fewest messages, the messages are queued at once and keep their order
+    :param message: Aiogram message object
+    :param lines: Lines of the text, Markdown is already escaped
+    :param markup: Keyboard markup for running keyboard, it is attached to the last message
+    :param del_msg: If del_msg delete message
+    :return: Sent messages to the message's author
+    """
+    chunks: List[str] = list(pack_lines(lines))
+    markups: List[MARKUPS] = [None] * (len(chunks) - 1) + [markup]
+    await gather(*(respond(message, chunk, chunk_markup, False) for chunk, chunk_markup in zip(chunks, markups)))
+    if del_msg:
+        delete_later(message)
+
+
 async def respond_with_photo(message: MESSAGES, img: str, text: str, markup: MARKUPS = None, del_msg=True) -> RESPONSE:
     """
     Sends private message to the message's author or warn about subscribing
@@ -45,12 +119,13 @@ async def respond_with_photo(message: MESSAGES, img: str, text: str, markup: MAR
     :return: Sent message to the message's author
     """
     try:
-        response = await bot.send_photo(message.from_user.id, img, text, reply_markup=markup, parse_mode="Markdown")
+        response = await sender.send(
+            PRIORITY_MENU,
+            message.from_user.id,
+            partial(bot.send_photo, message.from_user.id, img, text, reply_markup=markup, parse_mode="Markdown"),
+        )
         if del_msg:
-            if isinstance(message, CallbackQuery):
-                await message.message.delete()
-            else:
-                await message.delete()
+            delete_later(message)
         return response
     except aiogram_exceptions.CantInitiateConversation:
         await message.reply(ru.ERR_NOT_REG)
@@ -58,6 +133,38 @@ async def respond_with_photo(message: MESSAGES, img: str, text: str, markup: MAR
         await message.reply(ru.ERR_BLOCKED)
 
 
+async def respond_with_album(message: MESSAGES, media: List[InputMediaPhoto], del_msg=True) -> RESPONSE:
+    """
+    Sends private album to the message's author or warn about subscribing
+    :param message: Aiogram message object
+    :param media: From 2 to 10 photos with captions
+    :param del_msg: If del_msg delete message
+    :return: Sent messages of the album
+    """
+    try:
+        response = await sender.send(
+            PRIORITY_MENU, message.from_user.id, partial(bot.send_media_group, message.from_user.id, media)
+        )
+        if del_msg:
+            delete_later(message)
+        return response
+    except aiogram_exceptions.CantInitiateConversation:
+        await message.reply(ru.ERR_NOT_REG)
+    except aiogram_exceptions.BotBlocked:
+        await message.reply(ru.ERR_BLOCKED)
+
+
+async def send_file(chat_id: int, f_path: str) -> Message:
+    """
+    Sends the file, it is opened right before the request, so the send may wait in the queue
+    :param chat_id: Chat to send to
+    :param f_path: File path to send
+    :return: Sent message
+    """
+    with open(f_path, "rb") as file:
+        return await bot.send_document(chat_id, document=file)
+
+
 async def respond_file(message: MESSAGES, f_path: str, del_msg=True) -> RESPONSE:
     """
     Sends private message to the message's author or warn about subscribing
@@ -67,15 +174,28 @@ async def respond_file(message: MESSAGES, f_path: str, del_msg=True) -> RESPONSE
     :return: Sent message to the message's author
     """
     try:
-        with open(f_path, "rb") as file:
-            response = await bot.send_document(message.from_user.id, document=file)
+        request = partial(send_file, message.from_user.id, f_path)
+        response = await sender.send(PRIORITY_REPLY, message.from_user.id, request)
         if del_msg:
-            if isinstance(message, CallbackQuery):
-                await message.message.delete()
-            else:
-                await message.delete()
+            delete_later(message)
         return response
     except aiogram_exceptions.CantInitiateConversation:
         await message.reply(ru.ERR_NOT_REG)
     except aiogram_exceptions.BotBlocked:
         await message.reply(ru.ERR_BLOCKED)
+
+
+async def notify(user_id: int, text: str, markup: MARKUPS = None) -> RESPONSE:
+    """
+    Sends message about the payment ahead of other messages, e.g. payment's link or confirmation. Other errors than
+    the user's block or missing chat are raised, so the caller may send the message again
+    :param user_id: User's telegram id
+    :param text: Text of message for sending
+    :param markup: Keyboard markup for running keyboard
+    :return: Sent message or None if the user can't get it
+    """
+    try:
+        request = partial(bot.send_message, user_id, text, reply_markup=markup, parse_mode="Markdown")
+        return await sender.send(PRIORITY_PAYMENT, user_id, request)
+    except (aiogram_exceptions.Unauthorized, aiogram_exceptions.ChatNotFound) as exc:
+        logging.error(ru.ERR_NOT_NOTIFIED.format(user_id, exc))
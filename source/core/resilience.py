@@ -0,0 +1,142 @@
+import logging
+
+from random import uniform
+from time import monotonic
+from typing import Dict
+from urllib.parse import urlparse
+
+from localization import ru
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one host. It opens after a number of failures in a row and rejects requests without waiting for
+    the host, after the cooldown it lets one trial request through (half-open) and closes on its success
+    """
+
+    def __init__(self, host: str, threshold: int, cooldown: float):
+        self.host: str = host
+        self.threshold: int = threshold
+        self.cooldown: float = cooldown
+        self.failures: int = 0
+        self.opened: float = 0.0
+        self.trial: bool = False
+
+    @property
+    def state(self) -> str:
+        """
+        Current state of the breaker
+        :return: "closed", "open" or "half-open"
+        """
+        if self.failures < self.threshold:
+            return "closed"
+        return "half-open" if monotonic() - self.opened >= self.cooldown else "open"
+
+    @property
+    def available(self) -> bool:
+        """
+        Checks if the host may be asked now, without taking the trial request of the half-open breaker
+        :return: True if the breaker is closed or its cooldown is over
+        """
+        return self.state != "open" and not self.trial
+
+    def allow(self) -> bool:
+        """
+        Lets the request through: any while closed, the only trial one while half-open
+        :return: True if the request may be sent
+        """
+        state: str = self.state
+        if state == "half-open" and not self.trial:
+            self.trial = True
+            return True
+        return state == "closed"
+
+    def success(self) -> None:
+        """
+        Closes the breaker after a successful request
+        :return: Closed breaker
+        """
+        if self.failures >= self.threshold:
+            logging.info(ru.INF_CIRCUIT_CLOSED.format(self.host))
+        self.failures, self.trial = 0, False
+
+    def failure(self) -> None:
+        """
+        Counts the failed request and opens the breaker, if the failures have reached the threshold
+        :return: Counted failure
+        """
+        self.failures += 1
+        self.trial = False
+        if self.failures >= self.threshold:
+            if self.failures == self.threshold:
+                logging.warning(ru.WRN_CIRCUIT_OPENED.format(self.host, self.cooldown))
+            self.opened = monotonic()
+
+
+class CircuitBreakers:
+    """
+    Circuit breakers of all hosts, created on the first request to the host
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold: int = threshold
+        self.cooldown: float = cooldown
+        self.__hosts: Dict[str, CircuitBreaker] = dict()
+
+    def get(self, url: str) -> CircuitBreaker:
+        """
+        Finds the breaker of the url's host
+        :param url: Any url
+        :return: Breaker of the host
+        """
+        host: str = urlparse(url).netloc
+        if host not in self.__hosts:
+            self.__hosts[host] = CircuitBreaker(host, self.threshold, self.cooldown)
+        return self.__hosts[host]
+
+    def states(self) -> Dict[str, str]:
+        """
+        Collects states of the breakers
+        :return: State by host
+        """
+        return {host: breaker.state for host, breaker in self.__hosts.items()}
+
+
+class RetryBudget:
+    """
+    Retries shared by all outbound requests: every request adds a part of a retry to the budget, every retry takes
+    a whole one, so a failing host can't multiply the traffic by the number of attempts
+    """
+
+    def __init__(self, ratio: float, limit: float):
+        self.ratio: float = ratio
+        self.limit: float = limit
+        self.balance: float = limit
+
+    def deposit(self) -> None:
+        """
+        Adds the part of a retry for a new request
+        :return: Increased balance
+        """
+        self.balance = min(self.balance + self.ratio, self.limit)
+
+    def withdraw(self) -> bool:
+        """
+        Takes a retry from the budget
+        :return: True if the retry is allowed
+        """
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+def get_backoff(attempt: int, base: float, cap: float) -> float:
+    """
+    Finds the break before the retry: exponential backoff with full jitter
+    :param attempt: Number of the failed attempt, from zero
+    :param base: Break after the first attempt (sec)
+    :param cap: The longest break (sec)
+    :return: Break (sec)
+    """
+    return uniform(0, min(cap, base * 2**attempt))
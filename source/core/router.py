@@ -0,0 +1,122 @@
+import logging
+
+from aiogram import Dispatcher
+from aiogram.dispatcher import FSMContext
+from aiogram.types import CallbackQuery
+from inspect import signature
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from localization import ru
+
+
+class Route:
+    """
+    Callback query handler of one callback data's prefix with its counters
+    """
+
+    def __init__(self, prefix: str, handler: Callable, parse: Optional[Callable], state: Any, kwargs: Dict):
+        self.prefix: str = prefix
+        self.handler: Callable = handler
+        self.parse: Optional[Callable] = parse
+        self.state: Any = state
+        self.kwargs: Dict = kwargs
+        self.with_state: bool = "state" in signature(handler).parameters
+        self.hits: int = 0
+        self.errors: int = 0
+        self.duration: float = 0.0
+        self.max_duration: float = 0.0
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Counters of the route's usage"""
+        average: float = self.duration / self.hits if self.hits else 0.0
+        return {"hits": self.hits, "errors": self.errors, "average": average, "max": self.max_duration}
+
+
+class CallbackRouter:
+    """
+    The only callback query handler of the dispatcher. It finds the route by the longest prefix of the callback data in
+    a trie, so routing doesn't depend on the number of routes, and passes the parsed rest of the data to the route's
+    handler: handler(query, payload, **kwargs). A route without a parser matches the whole data only
+    """
+
+    def __init__(self):
+        self.__trie: Dict[str, Dict] = dict()
+        self.routes: Dict[str, Route] = dict()
+
+    def add(self, prefix: str, handler: Callable, parse: Callable = None, state: Any = None, **kwargs) -> None:
+        """
+        Adds the route
+        :param prefix: Prefix of the callback data, e.g. "order_add "
+        :param handler: Coroutine function, it gets the query, the payload, kwargs and FSMContext if it has "state"
+        :param parse: Type of the payload, e.g. str or int, the payload is the callback data without the prefix
+        :param state: State of the user, as the state filter of the aiogram, "*" for any state
+        :param kwargs: Fixed arguments of the handler, e.g. confirmed=True
+        :return: Added route
+        """
+        node: Dict[str, Dict] = self.__trie
+        for char in prefix:
+            node = node.setdefault(char, dict())
+        node[""] = self.routes[prefix] = Route(prefix, handler, parse, state, kwargs)
+
+    def find(self, data: str) -> Tuple[Optional[Route], str]:
+        """
+        Finds the route of the callback data
+        :param data: Callback data
+        :return: Route and the rest of the data or None if there is no route
+        """
+        node: Dict[str, Dict] = self.__trie
+        route: Optional[Route] = None
+        length: int = 0
+        for index, char in enumerate(data, 1):
+            node = node.get(char)
+            if node is None:
+                break
+            if "" in node and (node[""].parse or index == len(data)):
+                route, length = node[""], index
+        return route, data[length:]
+
+    async def dispatch(self, query: CallbackQuery, state: FSMContext) -> None:
+        """
+        Passes the callback query to the handler of its route
+        :param query: Aiogram CallbackQuery object
+        :param state: Aiogram FSMContext
+        :return: Handled query
+        """
+        route, rest = self.find(query.data or "")
+        if not route or route.state != "*" and await state.get_state() != route.state:
+            return
+        args: tuple = ()
+        if route.parse:
+            try:
+                args = (route.parse(rest),)
+            except ValueError:
+                logging.warning(ru.WRN_BAD_CALLBACK.format(query.data, query.from_user.id))
+                await query.answer()
+                return
+        kwargs: Dict = {**route.kwargs, "state": state} if route.with_state else route.kwargs
+        start: float = perf_counter()
+        try:
+            await route.handler(query, *args, **kwargs)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            duration: float = perf_counter() - start
+            route.hits += 1
+            route.duration += duration
+            route.max_duration = max(route.max_duration, duration)
+
+    def register(self, dp: Dispatcher) -> None:
+        """
+        Registers the router as the callback query handler in the dispatcher of the bot
+        :param dp: Dispatcher of the bot
+        :return: Registered router
+        """
+        dp.register_callback_query_handler(self.dispatch, state="*")
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Counters of the routes by prefix"""
+        return {prefix: route.stats for prefix, route in self.routes.items()}
@@ -0,0 +1,248 @@
+import json
+import logging
+
+from aiogram import Bot
+from aiogram.utils.exceptions import MessageCantBeDeleted, MessageToDeleteNotFound, NotFound, RetryAfter
+from aiogram.utils.exceptions import TelegramAPIError
+from functools import partial
+from asyncio import Future, Task, create_task, get_running_loop, sleep
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Priority classes of outbound messages, the lesser is sent first
+PRIORITY_PAYMENT = 0  # Payment links and confirmations
+PRIORITY_REPLY = 1  # Replies to the user's commands
+PRIORITY_MENU = 2  # Menu's photos and albums
+PRIORITY_DELETE = 3  # Deletion of the answered messages
+
+DELETE_BATCH = 100  # Bot API deleteMessages takes up to 100 messages
+
+
+class TokenBucket:
+    """
+    Token bucket of outbound messages: "rate" tokens per second, not more than "capacity" at once. Tokens are reserved
+    in advance, so the callers get their delays in the order of reservation
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated: float = monotonic()
+
+    def reserve(self) -> float:
+        """
+        Takes a token
+        :return: Delay (sec) before the token may be used
+        """
+        now: float = monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.capacity) - 1
+        self.updated = now
+        return max(-self.tokens / self.rate, 0)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Takes all tokens for the time, e.g. after the flood control's RetryAfter
+        :param seconds: Pause (sec)
+        :return: Paused bucket
+        """
+        self.reserve()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        """
+        Checks if the bucket has been refilled, so it may be forgotten
+        :return: True if the bucket is full
+        """
+        return self.tokens + (monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class SendScheduler:
+    """
+    Central queue of the Bot API sends. Every chat has its own queue sorted by priority, which is drained by one task:
+    it waits for the chat's token bucket, then for the global one, and takes the most urgent send of the chat only
+    then, so a payment link overtakes the menu's photos queued before it. The global token is taken right before the
+    request and is given to the most urgent of the waiting chats. Sends of the same priority to the same chat keep
+    their order. RetryAfter of the flood control pauses the chat and the send is repeated
+    """
+
+    def __init__(self, rate: float, chat_rate: float, chat_capacity: float):
+        self.__order = count()
+        self.__global = TokenBucket(rate, 1)
+        self.__waiters: List[Tuple[int, int, Future]] = []
+        self.__granter: Optional[Task] = None
+        self.__chats: Dict[int, TokenBucket] = dict()
+        self.__queues: Dict[int, List[Tuple]] = dict()
+        self.__drainers: Dict[int, Task] = dict()
+        self.chat_rate: float = chat_rate
+        self.chat_capacity: float = chat_capacity
+        self.stats: Dict[str, float] = {"queued": 0, "sent": 0, "failed": 0, "retries": 0, "max_wait": 0.0}
+
+    def send(self, priority: int, chat_id: int, request: Callable[[], Awaitable]) -> Future:
+        """
+        Queues the send
+        :param priority: PRIORITY_PAYMENT, PRIORITY_REPLY, PRIORITY_MENU or PRIORITY_DELETE
+        :param chat_id: Chat to send to
+        :param request: Function, which makes the Bot API request, e.g. partial(bot.send_message, chat_id, text)
+        :return: Future of the request's result
+        """
+        future: Future = get_running_loop().create_future()
+        heappush(self.__queues.setdefault(chat_id, []), (priority, next(self.__order), request, future, monotonic()))
+        self.stats["queued"] += 1
+        if chat_id not in self.__drainers:
+            self.__drainers[chat_id] = create_task(self.__drain(chat_id))
+        return future
+
+    @property
+    def depth(self) -> int:
+        """
+        Counts queued sends, which haven't been sent yet
+        :return: Queue depth
+        """
+        return sum(len(queue) for queue in self.__queues.values())
+
+    async def __drain(self, chat_id: int) -> None:
+        """
+        Sends the chat's queue by priority, spaced out by the chat's and the global token buckets
+        :param chat_id: Chat to send to
+        :return: None
+        """
+        queue: List[Tuple] = self.__queues[chat_id]
+        if chat_id not in self.__chats:
+            if len(self.__chats) > 10000:
+                self.__forget_idle()
+            self.__chats[chat_id] = TokenBucket(self.chat_rate, self.chat_capacity)
+        bucket: TokenBucket = self.__chats[chat_id]
+        try:
+            while queue:
+                await sleep(bucket.reserve())
+                await self.__acquire(queue[0][0])
+                send: Tuple = heappop(queue)
+                _, _, request, future, queued = send
+                self.stats["max_wait"] = max(self.stats["max_wait"], monotonic() - queued)
+                try:
+                    result = await request()
+                except RetryAfter as exc:
+                    self.stats["retries"] += 1
+                    bucket.pause(exc.timeout)
+                    heappush(queue, send)
+                    continue
+                except Exception as exc:
+                    self.stats["failed"] += 1
+                    if not future.cancelled():
+                        future.set_exception(exc)
+                    continue
+                self.stats["sent"] += 1
+                if not future.cancelled():
+                    future.set_result(result)
+        finally:
+            del self.__queues[chat_id], self.__drainers[chat_id]
+
+    async def __acquire(self, priority: int) -> None:
+        """
+        Waits for the global token, the waiters get tokens by priority
+        :param priority: Priority of the chat's most urgent send
+        :return: None
+        """
+        waiter: Future = get_running_loop().create_future()
+        heappush(self.__waiters, (priority, next(self.__order), waiter))
+        if not self.__granter or self.__granter.done():
+            self.__granter = create_task(self.__grant())
+        await waiter
+
+    async def __grant(self) -> None:
+        """
+        Gives global tokens to the waiting chats at the global rate, the most urgent waiter at the moment of the token
+        gets it
+        :return: None
+        """
+        while self.__waiters:
+            await sleep(self.__global.reserve())
+            while self.__waiters:
+                waiter: Future = heappop(self.__waiters)[2]
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+
+    def __forget_idle(self) -> None:
+        """
+        Forgets buckets of the chats, which have been silent long enough to refill them
+        :return: None
+        """
+        for chat_id in [chat_id for chat_id, bucket in self.__chats.items() if bucket.idle]:
+            if chat_id not in self.__queues:
+                del self.__chats[chat_id]
+
+
+class DeleteQueue:
+    """
+    Deferred deletion of the answered messages. Messages are collected by chat for a while and deleted by one
+    deleteMessages request per chat through the send scheduler, so the handler doesn't wait for the deletion. If the
+    Bot API server doesn't know deleteMessages, messages are deleted one by one
+    """
+
+    def __init__(self, bot: Bot, scheduler: SendScheduler, period: float):
+        self.bot: Bot = bot
+        self.scheduler: SendScheduler = scheduler
+        self.period: float = period
+        self.batches: bool = True
+        self.__pending: Dict[int, List[int]] = dict()
+        self.__worker: Optional[Task] = None
+        self.stats: Dict[str, int] = {"deleted": 0, "delete_requests": 0}
+
+    def delete(self, chat_id: int, message_id: int) -> None:
+        """
+        Queues the message's deletion
+        :param chat_id: Chat of the message
+        :param message_id: Message to delete
+        :return: None
+        """
+        self.__pending.setdefault(chat_id, []).append(message_id)
+        if not self.__worker or self.__worker.done():
+            self.__worker = create_task(self.__flush())
+
+    async def __flush(self) -> None:
+        """
+        Waits for more messages and hands the collected ones to the scheduler, a batch per chat
+        :return: None
+        """
+        await sleep(self.period)
+        pending, self.__pending = self.__pending, dict()
+        for chat_id, message_ids in pending.items():
+            for start in range(0, len(message_ids), DELETE_BATCH):
+                batch: List[int] = message_ids[start : start + DELETE_BATCH]
+                self.scheduler.send(PRIORITY_DELETE, chat_id, partial(self.__delete, chat_id, batch))
+
+    async def __delete(self, chat_id: int, message_ids: List[int]) -> None:
+        """
+        Deletes messages of the chat, already deleted and too old messages are skipped
+        :param chat_id: Chat of the messages
+        :param message_ids: Up to 100 messages to delete
+        :return: None
+        """
+        if self.batches and len(message_ids) > 1:
+            self.stats["delete_requests"] += 1
+            try:
+                await self.bot.request("deleteMessages", {"chat_id": chat_id, "message_ids": json.dumps(message_ids)})
+                self.stats["deleted"] += len(message_ids)
+                return
+            except RetryAfter:
+                raise
+            except NotFound:  # Old Bot API server without deleteMessages
+                self.batches = False
+            except TelegramAPIError as exc:
+                logging.error(exc)
+        for message_id in message_ids:
+            self.stats["delete_requests"] += 1
+            try:
+                await self.bot.delete_message(chat_id, message_id)
+                self.stats["deleted"] += 1
+            except (MessageCantBeDeleted, MessageToDeleteNotFound):
+                pass
+            except RetryAfter:
+                raise
+            except TelegramAPIError as exc:
+                logging.error(exc)
@@ -0,0 +1,279 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class MenuCache:
+    """
+    Process-level cache of menu's categories. Every change of products drops the categories of the changed products,
+    the writers call it right after commit, so the cache never serves rows older than the database. Carts aren't
+    cached here, they have their own mirror
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__categories: Dict[str, List] = dict()
+        self.__products: Dict[str, str] = dict()
+        self.generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, category: str) -> Optional[List]:
+        """
+        Requests cached products of the category
+        :param category: Category's slug
+        :return: Cached products or None if the category isn't cached
+        """
+        products: Optional[List] = self.__categories.get(category)
+        if products is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return products
+
+    def put(self, category: str, products: List, generation: int) -> None:
+        """
+        Caches products of the category if nothing has been changed since they were requested
+        :param category: Category's slug
+        :param products: Products of the category, the product's name must be the second field
+        :param generation: Cache's generation before the request of products
+        :return: Cached products
+        """
+        with self.__lock:
+            if generation != self.generation:
+                return
+            self.__categories[category] = products
+            self.__products.update((product[1], category) for product in products)
+
+    def invalidate(self, *names: str, categories: tuple = ()) -> None:
+        """
+        Drops cached categories of the products
+        :param names: Names of changed products
+        :param categories: Slugs of the changed categories, e.g. of a new product
+        :return: Dropped categories
+        """
+        with self.__lock:
+            self.generation += 1
+            for category in {*categories, *(self.__products.get(name) for name in names)}:
+                for product in self.__categories.pop(category, ()):
+                    self.__products.pop(product[1], None)
+
+    def clear(self) -> None:
+        """
+        Drops all cached categories
+        :return: Empty cache
+        """
+        with self.__lock:
+            self.generation += 1
+            self.__categories.clear()
+            self.__products.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counters of the cache's usage"""
+        return {"categories": len(self.__categories), "hits": self.hits, "misses": self.misses}
+
+
+class KnownUsers:
+    """
+    Set of registered users' telegram ids. New users are remembered at once and saved into database in batches
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__users: Set[int] = set()
+        self.__pending: Set[int] = set()
+
+    def load(self, users: Iterable[int]) -> None:
+        """
+        Remembers users registered in database
+        :param users: Telegram ids of the users
+        :return: Loaded users
+        """
+        with self.__lock:
+            self.__users.update(users)
+
+    def add(self, user_id: int) -> bool:
+        """
+        Remembers the user and queues him to be saved if he is new
+        :param user_id: User's telegram id
+        :return: True if the user is new
+        """
+        if user_id in self.__users:
+            return False
+        with self.__lock:
+            self.__users.add(user_id)
+            self.__pending.add(user_id)
+        return True
+
+    def pop_pending(self) -> Set[int]:
+        """
+        Takes users queued to be saved
+        :return: Telegram ids of the new users
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, set()
+        return pending
+
+    def return_pending(self, users: Iterable[int]) -> None:
+        """
+        Queues the users back if they haven't been saved
+        :param users: Telegram ids of the users
+        :return: Queued users
+        """
+        with self.__lock:
+            self.__pending.update(users)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.__users
+
+
+class Carts:
+    """
+    In-memory mirror of the pre_order table: items in every user's cart and items of every product in all carts. The
+    writers update it right after commit, so the menu gets the carts without requests and its cache isn't dropped
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__carts: Dict[int, Dict[str, int]] = dict()
+        self.__reserved: Dict[str, int] = dict()
+
+    def load(self, rows: Iterable[Tuple[str, int, int]]) -> None:
+        """
+        Replaces all carts
+        :param rows: Product's name, user's telegram id and count
+        :return: Loaded carts
+        """
+        with self.__lock:
+            self.__carts.clear()
+            self.__reserved.clear()
+        for product, user_id, count in rows:
+            self.set(user_id, product, count)
+
+    def set(self, user_id: int, product: str, count: int) -> None:
+        """
+        Sets count of the product in the user's cart
+        :param user_id: User's telegram id
+        :param product: Product's name
+        :param count: Product's count, 0 removes the product from the cart
+        :return: Changed cart
+        """
+        user_id = int(user_id)
+        with self.__lock:
+            cart: Dict[str, int] = self.__carts.setdefault(user_id, dict())
+            reserved: int = self.__reserved.get(product, 0) - cart.pop(product, 0) + count
+            if count:
+                cart[product] = count
+            elif not cart:
+                del self.__carts[user_id]
+            if reserved:
+                self.__reserved[product] = reserved
+            else:
+                self.__reserved.pop(product, None)
+
+    def empty(self, user_id: int) -> None:
+        """
+        Removes all products from the user's cart
+        :param user_id: User's telegram id
+        :return: Empty cart
+        """
+        for product in self.cart(user_id):
+            self.set(user_id, product, 0)
+
+    def clear(self) -> None:
+        """
+        Removes all products from all carts
+        :return: Empty carts
+        """
+        self.load(())
+
+    def cart(self, user_id: int) -> Dict[str, int]:
+        """
+        Requests the user's cart
+        :param user_id: User's telegram id
+        :return: Count by product's name
+        """
+        with self.__lock:
+            return dict(self.__carts.get(int(user_id), ()))
+
+    def reserved(self, product: str) -> int:
+        """
+        Counts product's items in all carts
+        :param product: Product's name
+        :return: Count of the items
+        """
+        return self.__reserved.get(product, 0)
+
+
+class ShiftTotals:
+    """
+    In-memory mirror of the shift_totals table: paid count and total price of every product paid during the shift
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__products: Dict[str, Tuple[int, float]] = dict()
+
+    def update(self, rows: Iterable[Tuple[str, int, float]]) -> None:
+        """
+        Updates totals of the products
+        :param rows: Product's name, paid count and total price
+        :return: Updated totals
+        """
+        with self.__lock:
+            self.__products.update((product, (count, float(price))) for product, count, price in rows)
+
+    def reset(self, rows: Iterable[Tuple[str, int, float]] = ()) -> None:
+        """
+        Replaces all totals
+        :param rows: Product's name, paid count and total price
+        :return: New totals
+        """
+        with self.__lock:
+            self.__products.clear()
+            self.__products.update((product, (count, float(price))) for product, count, price in rows)
+
+    def rows(self) -> List[Tuple[str, int, float]]:
+        """
+        Lists totals of paid products ordered by name
+        :return: Product's name, paid count and total price
+        """
+        with self.__lock:
+            return [(product, *total) for product, total in sorted(self.__products.items()) if total[0]]
+
+
+class LruCache:
+    """
+    LRU cache, e.g. of short links: the freshest links are asked most of all, the old ones are forgotten first
+    """
+
+    def __init__(self, size: int):
+        self.__lock = Lock()
+        self.__items: OrderedDict = OrderedDict()
+        self.size: int = size
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Requests the cached value
+        :param key: Key of the value, e.g. short link's code
+        :return: Value or None if it isn't cached
+        """
+        with self.__lock:
+            value: Any = self.__items.get(key)
+            if value is not None:
+                self.__items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Caches the value and forgets the least recently used one, if the cache is full
+        :param key: Key of the value, e.g. short link's code
+        :param value: Value, e.g. url of the link
+        :return: Cached value
+        """
+        with self.__lock:
+            self.__items[key] = value
+            self.__items.move_to_end(key)
+            if len(self.__items) > self.size:
+                self.__items.popitem(last=False)
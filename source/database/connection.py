@@ -0,0 +1,90 @@
+import sqlite3 as sql
+
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from pathlib import Path
+from threading import local
+from typing import Any, Awaitable, Callable, Dict, Tuple, Union
+
+from core.config import DB_READERS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_BUSY_TIMEOUT
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA recursive_triggers = ON",
+)
+
+
+class ConnectionPool:
+    """
+    Pool of sqlite connections bound to the database threads: a single writer and several readers.
+    In WAL mode readers never wait for the writer, so reports and menus don't block carts and payments
+    """
+
+    def __init__(self, path: Path, readers: int = DB_READERS):
+        self.path = path
+        self.__local = local()
+        self.__writer = ThreadPoolExecutor(1, "CafeBarDBWriter", self.__connect, (False,))
+        self.__readers = ThreadPoolExecutor(readers, "CafeBarDBReader", self.__connect, (True,))
+
+    def __connect(self, read_only: bool) -> None:
+        """
+        Opens the connection of the current database thread
+        :param read_only: Forbids changes through this connection
+        :return: Opened and tuned connection
+        """
+        connection = sql.connect(self.path)
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        self.__local.connection = connection
+
+    @property
+    def connection(self) -> sql.Connection:
+        """Connection of the current database thread"""
+        return self.__local.connection
+
+    def execute(self, query: str, params: Union[Tuple, Dict] = ()) -> sql.Cursor:
+        """Executes the query with the connection of the current database thread"""
+        return self.connection.execute(query, params)
+
+    def commit(self) -> None:
+        """Commits the transaction of the current database thread"""
+        self.connection.commit()
+
+    @staticmethod
+    def __task(executor: ThreadPoolExecutor, function: Callable) -> Callable[..., Awaitable[Any]]:
+        """
+        Makes a blocking database function awaitable by running it in the executor
+        :param executor: Executor of the writer or of the readers
+        :param function: Function with sqlite requests
+        :return: Coroutine function with the same signature
+        """
+
+        @wraps(function)
+        async def wrapper(*args, **kwargs) -> Any:
+            return await get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
+
+        return wrapper
+
+    def reader(self, function: Callable) -> Callable[..., Awaitable[Any]]:
+        """Runs the function with one of the read-only connections"""
+        return self.__task(self.__readers, function)
+
+    def writer(self, function: Callable) -> Callable[..., Awaitable[Any]]:
+        """Runs the function with the only connection allowed to change the database"""
+        return self.__task(self.__writer, function)
+
+    def close(self) -> None:
+        """
+        Waits for the started requests and stops the database threads
+        :return: Closed connections
+        """
+        self.__writer.shutdown()
+        self.__readers.shutdown()
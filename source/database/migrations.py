@@ -0,0 +1,153 @@
+import sqlite3 as sql
+
+from datetime import datetime as dt
+from typing import Tuple
+
+from core.config import logging
+from localization import ru
+
+# In-between statuses of the bank's payment, which were saved by the previous versions
+IN_BETWEEN_STATUSES = (
+    "('FORM_SHOWED', 'AUTHORIZING', '3DS_CHECKING', '3DS_CHECKED', 'AUTHORIZED', 'CONFIRMING', 'AUTH_FAIL')"
+)
+
+# Ordered schema changes: the number of a migration is its position in the tuple starting from 1.
+# Never edit or reorder applied migrations, only append new ones.
+MIGRATIONS: Tuple[Tuple[str, ...], ...] = (
+    # 1. Indexes for the hot paths: carts, new payments, shift reports and paid products
+    (
+        "CREATE INDEX IF NOT EXISTS pre_order_product_idx ON pre_order(product, user_id, count)",
+        "CREATE INDEX IF NOT EXISTS pre_order_user_idx ON pre_order(user_id, count)",
+        "CREATE INDEX IF NOT EXISTS payment_user_idx ON payment(user_id)",
+        "CREATE INDEX IF NOT EXISTS payment_status_time_idx ON payment(status, date_time)",
+        "CREATE INDEX IF NOT EXISTS payment_new_user_idx ON payment(user_id, date_time) WHERE status = 'NEW'",
+        "CREATE INDEX IF NOT EXISTS payment_new_time_idx ON payment(date_time, payment_id, user_id) "
+        "WHERE status = 'NEW'",
+        "CREATE INDEX IF NOT EXISTS paid_product_payment_idx ON paid_product(payment_id, product, count, price)",
+    ),
+    # 2. Count of product's items in all carts, kept up to date by pre_order's triggers
+    (
+        "ALTER TABLE product ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0",
+        "UPDATE product SET reserved = (SELECT coalesce(sum(count), 0) FROM pre_order WHERE product == product.name)",
+        "CREATE TRIGGER IF NOT EXISTS pre_order_reserve_insert AFTER INSERT ON pre_order BEGIN "
+        "   UPDATE product SET reserved = reserved + NEW.count WHERE name == NEW.product; "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS pre_order_reserve_update AFTER UPDATE OF product, count ON pre_order BEGIN "
+        "   UPDATE product SET reserved = reserved - OLD.count WHERE name == OLD.product; "
+        "   UPDATE product SET reserved = reserved + NEW.count WHERE name == NEW.product; "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS pre_order_reserve_delete AFTER DELETE ON pre_order BEGIN "
+        "   UPDATE product SET reserved = reserved - OLD.count WHERE name == OLD.product; "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS product_reserve_insert AFTER INSERT ON product BEGIN "
+        "   UPDATE product SET reserved = (SELECT coalesce(sum(count), 0) FROM pre_order WHERE product == NEW.name) "
+        "   WHERE rowid == NEW.rowid; "
+        "END",
+    ),
+    # 3. Running totals of the shift, updated when payments are confirmed
+    (
+        "CREATE TABLE IF NOT EXISTS shift_totals("
+        "   product     TEXT    NOT NULL    PRIMARY KEY CHECK ( length(product) >= 1 )                                ,"
+        "   paid_count  INTEGER NOT NULL    DEFAULT 0                                                                 ,"
+        "   total_price REAL    NOT NULL    DEFAULT 0                                                                  "
+        ")",
+    ),
+    # 4. Archive of the closed shifts' payments, so the hot tables hold only the current shift
+    (
+        "CREATE TABLE IF NOT EXISTS payment_archive("
+        "   id          INTEGER PRIMARY KEY                                                                           ,"
+        "   date_time   REAL    NOT NULL                                                                              ,"
+        "   user_id     INTEGER NOT NULL                                                                              ,"
+        "   payment_id  INTEGER                                                                                       ,"
+        "   amount      REAL    NOT NULL                                                                              ,"
+        "   status      TEXT    NOT NULL                                                                               "
+        ")",
+        "CREATE TABLE IF NOT EXISTS paid_product_archive("
+        "   payment_id  INTEGER NOT NULL                                                                              ,"
+        "   product     TEXT    NOT NULL                                                                              ,"
+        "   price       REAL    NOT NULL                                                                              ,"
+        "   count       INTEGER NOT NULL                                                                               "
+        ")",
+        "CREATE INDEX IF NOT EXISTS payment_archive_user_idx ON payment_archive(user_id)",
+        "CREATE INDEX IF NOT EXISTS paid_product_archive_payment_idx ON paid_product_archive(payment_id)",
+    ),
+    # 5. Short links to the payment pages, served by the bot itself
+    (
+        "CREATE TABLE IF NOT EXISTS short_link("
+        "   code        TEXT    NOT NULL    PRIMARY KEY                                                               ,"
+        "   url         TEXT    NOT NULL                                                                              ,"
+        "   created     REAL    NOT NULL                                                                               "
+        ") WITHOUT ROWID",
+    ),
+    # 6. Outbox of the bank's operations, processed by background workers until they succeed
+    (
+        "CREATE TABLE IF NOT EXISTS outbox("
+        "   id          INTEGER PRIMARY KEY                                                                           ,"
+        "   operation   TEXT    NOT NULL                CHECK ( operation IN ('init', 'cancel') )                     ,"
+        "   payment_id  INTEGER NOT NULL                                                                              ,"
+        "   key         TEXT    NOT NULL    UNIQUE                                                                    ,"
+        "   attempts    INTEGER NOT NULL    DEFAULT 0                                                                 ,"
+        "   due         REAL    NOT NULL                                                                               "
+        ")",
+        "CREATE INDEX IF NOT EXISTS outbox_due_idx ON outbox(due)",
+    ),
+    # 7. In-between statuses of the bank aren't saved any more: payments stuck in them, even archived ones, become NEW
+    # again to be polled till the final status or expired and returned to stock
+    (
+        "INSERT INTO payment(id, date_time, user_id, payment_id, amount, status) "
+        "SELECT id, date_time, user_id, payment_id, amount, 'NEW' FROM payment_archive "
+        f"WHERE status IN {IN_BETWEEN_STATUSES}",
+        "INSERT INTO paid_product(payment_id, product, price, count) "
+        "SELECT payment_id, product, price, count FROM paid_product_archive "
+        f"WHERE payment_id IN (SELECT id FROM payment_archive WHERE status IN {IN_BETWEEN_STATUSES})",
+        "DELETE FROM paid_product_archive "
+        f"WHERE payment_id IN (SELECT id FROM payment_archive WHERE status IN {IN_BETWEEN_STATUSES})",
+        f"DELETE FROM payment_archive WHERE status IN {IN_BETWEEN_STATUSES}",
+        f"UPDATE payment SET status = 'NEW' WHERE status IN {IN_BETWEEN_STATUSES}",
+    ),
+    # 8. The payment keeps its link till the link is sent to the payer, so a lost message is sent again. Links of the
+    # existing payments have been sent
+    (
+        "ALTER TABLE payment ADD COLUMN payment_url TEXT",
+        "ALTER TABLE payment ADD COLUMN link_sent INTEGER NOT NULL DEFAULT 0",
+        "UPDATE payment SET link_sent = 1 WHERE payment_id IS NOT NULL",
+    ),
+)
+
+
+def get_version(base: sql.Connection) -> int:
+    """
+    Requests the current schema version
+    :param base: Connection to the database
+    :return: Number of the last applied migration or 0 for a new database
+    """
+    base.execute(
+        "CREATE TABLE if NOT EXISTS schema_version("
+        "   version     INTEGER PRIMARY KEY                                                                           ,"
+        "   applied     REAL    NOT NULL                                                                               "
+        ")"
+    )
+    return base.execute("SELECT max(version) FROM schema_version").fetchone()[0] or 0
+
+
+def migrate(base: sql.Connection) -> int:
+    """
+    Applies not yet applied migrations, each one in its own transaction
+    :param base: Connection to the database
+    :return: Schema version after migration
+    """
+    version: int = get_version(base)
+    for number, steps in enumerate(MIGRATIONS[version:], version + 1):
+        base.execute("BEGIN IMMEDIATE")
+        try:
+            for step in steps:
+                base.execute(step)
+            base.execute("INSERT INTO schema_version(version, applied) VALUES (?,?)", (number, dt.now().timestamp()))
+        except sql.Error:
+            base.rollback()
+            logging.error(ru.ERR_DB_MIGRATION.format(number))
+            raise
+        base.commit()
+        logging.info(ru.INF_DB_MIGRATED.format(number))
+        version: int = number
+    return version
@@ -1,25 +1,58 @@
+import json
 import sqlite3 as sql
 
 from datetime import datetime as dt, timedelta as td
-from typing import List, Tuple, Union
+from secrets import token_urlsafe
+from typing import Iterable, List, Set, Tuple, Union
 
-from core.config import logging, BASE_DIR, START_SHIFT
+from core.config import logging, BASE_DIR, SHORT_LINKS_CACHE, START_SHIFT, STATE_PAYMENT_LIFETIME
+from database.cache import Carts, KnownUsers, LruCache, MenuCache, ShiftTotals
+from database.connection import ConnectionPool
+from database.migrations import migrate
 from localization import ru
 
-base = sql.connect(BASE_DIR / "CafeBar.db")
-cur = base.cursor()
-
-
+pool = ConnectionPool(BASE_DIR / "CafeBar.db")
+menu_cache = MenuCache()
+known_users = KnownUsers()
+carts = Carts()
+shift_totals = ShiftTotals()
+link_cache = LruCache(SHORT_LINKS_CACHE)
+
+# Repeated operation with the same key is merged with the pending one, e.g. the second init of the same order. The new
+# due time tells the worker, which is busy with the old one, that the operation must be done once more
+OUTBOX_INSERT = (
+    "INSERT INTO outbox(operation, payment_id, key, due) VALUES(?,?,?,?) "
+    "ON CONFLICT(key) DO UPDATE SET attempts = 0, due = excluded.due"
+)
+PRODUCT_FIELDS = "category", "image", "name", "description", "price", "count"
+# Bank's statuses, after which the payment doesn't change any more, except for the refund of the confirmed one. Other
+# statuses are in-between ones: they aren't saved, the payment stays NEW and is polled till one of these
+# https://www.tinkoff.ru/kassa/develop/api/payments/
+FINAL_STATUSES = "CONFIRMED", "REJECTED", "CANCELED", "DEADLINE_EXPIRED", "REVERSED", "REFUNDED"
+# Final statuses of unpaid payments, whose products return to stock
+NOT_PAID_STATUSES = "REJECTED", "CANCELED", "DEADLINE_EXPIRED", "REVERSED"
+# Statuses, into which the saved one may change. The payment goes only forward, so a late or repeated status of the bank
+# can't undo the final one. The only way back is the confirmation of the payment, which has expired or been cancelled
+# here while the payer was paying: the money is taken, so its products are taken from stock once more
+STATUS_TRANSITIONS = {
+    "NEW": ("CONFIRMED", "REJECTED", "CANCELED", "DEADLINE_EXPIRED", "REVERSED", "EXPIRED"),
+    "CONFIRMED": ("REFUNDED",),
+    "EXPIRED": ("CONFIRMED",),
+    "CANCELED": ("CONFIRMED",),
+}
+# Payments with these statuses are finished for the shift and go into archive, when it is closing
+ARCHIVED_STATUSES = json.dumps([*FINAL_STATUSES, "EXPIRED"])
+# Tables of the current shift's payments and of the archived ones with their products
+PAYMENT_TABLES = ("payment", "paid_product"), ("payment_archive", "paid_product_archive")
+
+
+@pool.writer
 def sql_start() -> None:
     """
-    Creates CafeBar database if not exists
+    Creates CafeBar database if not exists and upgrades its schema
     :return: created CafeBar database
     """
-    if base:
-        logging.info(ru.INF_DB_CONNECTED)
-    else:
-        logging.info(ru.ERR_FAILED_BD)
-        raise sql.DatabaseError
+    base: sql.Connection = pool.connection
     base.execute(
         "CREATE TABLE if NOT EXISTS client("
         "   user_id     INTEGER NOT NULL    UNIQUE      CHECK ( user_id BETWEEN 100000000 AND 999999999 )             ,"
@@ -65,28 +98,59 @@ def sql_start() -> None:
         ")"
     )
     base.commit()
+    migrate(base)
+    known_users.load(user[0] for user in base.execute("SELECT user_id FROM client"))
+    carts.load(base.execute("SELECT product, user_id, count FROM pre_order WHERE count > 0"))
+    logging.info(ru.INF_DB_CONNECTED)
+
+
+def sql_stop() -> None:
+    """
+    Waits for the started requests and closes CafeBar database
+    :return: Closed CafeBar database
+    """
+    pool.close()
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
 # Get requests to client database                                                                                      #
 # -------------------------------------------------------------------------------------------------------------------- #
-def check_user(user_id: str) -> int:
+def check_user(user_id: int) -> bool:
     """
-    Checks user's id in client
+    Checks user's id among known users and queues new user to be added
     :param user_id: User's id
-    :return: 1 if user's id exists or 0 if not
+    :return: True if the user is new
     """
-    return cur.execute("SELECT count(*) FROM client WHERE user_id == ?", (user_id,)).fetchone()[0]
+    return known_users.add(user_id)
 
 
-def add_user(user_id) -> None:
+@pool.writer
+def add_users(users: Iterable[int]) -> int:
     """
-    Adds new user
-    :param user_id: User telegram id
-    :return: Added user
+    Adds new users, already registered ones are ignored
+    :param users: Users' telegram ids
+    :return: Count of added users
     """
-    cur.execute("INSERT INTO client(user_id) VALUES (?)", (user_id,))
+    base: sql.Connection = pool.connection
+    changes: int = base.total_changes
+    base.executemany("INSERT OR IGNORE INTO client(user_id) VALUES (?)", ((user_id,) for user_id in users))
     base.commit()
+    return base.total_changes - changes
+
+
+async def flush_users() -> Set[int]:
+    """
+    Saves users queued by check_user into database
+    :return: Saved users' telegram ids
+    """
+    users: Set[int] = known_users.pop_pending()
+    if users:
+        try:
+            await add_users(users)
+        except sql.Error:
+            known_users.return_pending(users)
+            raise
+    return users
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -95,15 +159,17 @@ def add_user(user_id) -> None:
 # -------------------------------------------------------------------------------------------------------------------- #
 # Get requests to preorder database                                                                               #
 # -------------------------------------------------------------------------------------------------------------------- #
+@pool.reader
 def get_pre_order(user_id: Union[str, int]) -> List:
     """
     Requests preorder cart objects filtered by user_id
     :param user_id: User's telegram id
     :return: User's preorder cart data with matching telegram id
     """
-    return cur.execute("SELECT product, count FROM pre_order WHERE user_id == ?", (user_id,)).fetchall() or []
+    return pool.execute("SELECT product, count FROM pre_order WHERE user_id == ?", (user_id,)).fetchall() or []
 
 
+@pool.reader
 def check_in_pre_order(product: str, user_id: Union[str, int]) -> int:
     """
     Checks product in user's preorder cart
@@ -111,60 +177,50 @@ def check_in_pre_order(product: str, user_id: Union[str, int]) -> int:
     :param user_id: User's telegram id
     :return: 1 if product is in preorder cart or 0 if not
     """
-    result: Tuple = cur.execute(
+    result: Tuple = pool.execute(
         "SELECT count FROM pre_order WHERE product == ? AND user_id == ? LIMIT 1", (product, user_id)
     ).fetchone()
     return (result or (-1,))[0]
 
 
-def get_ordered(product: str, user_id: Union[int, str]) -> int:
+@pool.reader
+def get_available(product: str, user_id: Union[int, str]) -> int:
     """
-    Checks dishes in preorder carts of other users
+    Counts product's items which the user can order
     :param product: Product's name
     :param user_id: User's telegram id
-    :return: Ordered dish's count
+    :return: Count of product in stock without items from preorder carts of other users
     """
-    result: int = cur.execute(
-        "SELECT sum(count) FROM pre_order WHERE product == ? AND user_id != ? ORDER BY product",
-        (product, user_id),
-    ).fetchone()[0]
-    return result or 0
+    result: Tuple = pool.execute(
+        "SELECT p.count - p.reserved + coalesce(po.count, 0) "
+        "FROM product as p LEFT JOIN pre_order as po ON po.product = p.name AND po.user_id == ? "
+        "WHERE p.name == ?",
+        (user_id, product),
+    ).fetchone()
+    return (result or (0,))[0]
 
 
+@pool.reader
 def get_orders(user_id: Union[int, str]) -> List:
     """
     Collects user's orders
     :param user_id: User's telegram id
     :return: User's orders
     """
-    result: List = cur.execute(
+    result: List = pool.execute(
         "SELECT p.image, p.name, p.description, p.price, po.count "
         "FROM product as p INNER JOIN pre_order as po ON p.name = po.product "
         "WHERE po.count > 0 AND po.user_id == ?",
         (user_id,),
     ).fetchall()
     return result or []
-
-
-def get_orders_to_pay(user_id: Union[int, str]) -> List:
-    """
-    Collects user's orders
-    :param user_id: User's telegram id
-    :return: User's orders
-    """
-    result: List = cur.execute(
-        "SELECT p.name, p.price, po.count "
-        "FROM product as p INNER JOIN pre_order as po ON p.name = po.product "
-        "WHERE po.count > 0 AND po.user_id == ?",
-        (user_id,),
-    ).fetchall()
-    return result or []
 # -------------------------------------------------------------------------------------------------------------------- #
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
 # Change requests to preorder database                                                                                #
 # -------------------------------------------------------------------------------------------------------------------- #
+@pool.writer
 def add_product_into_cart(product: str, user_id: Union[int, str], count: int) -> None:
     """
     Add product into the user's preorder cart
@@ -173,13 +229,16 @@ def add_product_into_cart(product: str, user_id: Union[int, str], count: int) ->
     :param count: Product's count
     :return: Added product into the user's cart
     """
-    if check_in_pre_order(product, user_id) == -1:
-        cur.execute("INSERT INTO pre_order(product, user_id, count) VALUES (?,?,?)", (product, user_id, count))
-        base.commit()
-    else:
-        update_in_cart_product_count(count, product, user_id)
+    pool.execute(
+        "INSERT INTO pre_order(product, user_id, count) VALUES (?,?,?) "
+        "ON CONFLICT(product, user_id) DO UPDATE SET count = excluded.count",
+        (product, user_id, count),
+    )
+    pool.commit()
+    carts.set(user_id, product, count)
 
 
+@pool.writer
 def update_in_cart_product_count(count: int, product: str, user_id: Union[int, str]) -> None:
     """
     Updates product's count in the user's preorder cart
@@ -188,89 +247,173 @@ def update_in_cart_product_count(count: int, product: str, user_id: Union[int, s
     :param user_id: User's telegram ID
     :return: Updated count of the product in the user's cart
     """
-    cur.execute("UPDATE pre_order SET count = ? WHERE product == ? AND user_id == ?", (count, product, user_id))
-    base.commit()
+    changed: int = pool.execute(
+        "UPDATE pre_order SET count = ? WHERE product == ? AND user_id == ?", (count, product, user_id)
+    ).rowcount
+    pool.commit()
+    if changed:
+        carts.set(user_id, product, count)
 
 
+@pool.writer
 def cancel_user_orders(user_id: Union[int, str]) -> None:
     """
     Cancels all user's orders
     :param user_id: User's telegram ID
     :return: Canceled user's orders
     """
-    cur.execute("UPDATE pre_order SET count = 0 WHERE user_id == ?", (user_id,))
-    base.commit()
+    pool.execute("UPDATE pre_order SET count = 0 WHERE user_id == ? AND count > 0", (user_id,))
+    pool.commit()
+    carts.empty(user_id)
 
 
+@pool.writer
 def close_orders() -> None:
     """
     Cancels all orders when shift is closing
     :return: Canceled orders
     """
-    cur.execute("UPDATE pre_order SET count = 0")
-    base.commit()
+    pool.execute("UPDATE pre_order SET count = 0")
+    pool.commit()
+    carts.clear()
 
 
-def change_payment_status(status: str, payment_id: int) -> None:
+@pool.writer
+def archive_shift() -> int:
     """
-    Changes the status to the one from the bank's response
-    :param payment_id: In database payment id
-    :param status: New status from bank
-    :return: Updated payment status
+    Moves finished payments and their products into archive and deletes empty preorders when shift is closing. Payments
+    in progress stay in the current shift and are polled further
+    :return: Count of archived payments
     """
-    cur.execute("UPDATE payment SET status = ? WHERE id == ?", (status, payment_id))
-    base.commit()
-# -------------------------------------------------------------------------------------------------------------------- #
+    base: sql.Connection = pool.connection
+    finished: str = "SELECT id FROM payment WHERE status IN (SELECT value FROM json_each(?))"
+    with base:
+        base.execute(
+            "INSERT INTO paid_product_archive(payment_id, product, price, count) "
+            f"SELECT payment_id, product, price, count FROM paid_product WHERE payment_id IN ({finished})",
+            (ARCHIVED_STATUSES,),
+        )
+        base.execute(f"DELETE FROM paid_product WHERE payment_id IN ({finished})", (ARCHIVED_STATUSES,))
+        base.execute(
+            "INSERT INTO payment_archive(id, date_time, user_id, payment_id, amount, status) "
+            f"SELECT id, date_time, user_id, payment_id, amount, status FROM payment WHERE id IN ({finished})",
+            (ARCHIVED_STATUSES,),
+        )
+        archived: int = base.execute(f"DELETE FROM payment WHERE id IN ({finished})", (ARCHIVED_STATUSES,)).rowcount
+        base.execute("DELETE FROM pre_order WHERE count == 0")
+        old: float = (dt.now() - td(seconds=STATE_PAYMENT_LIFETIME)).timestamp()
+        base.execute("DELETE FROM short_link WHERE created < ?", (old,))
+    return archived
+
+
+@pool.writer
+def change_payment_statuses(statuses: Iterable[Tuple[str, int]]) -> List[Tuple[str, int, int]]:
+    """
+    Changes the statuses to the ones from the bank's responses in one transaction and updates running totals of the
+    shift for the payments, which have been confirmed or refunded. Only the changes of STATUS_TRANSITIONS are made,
+    others are skipped, so the bank's answers may be applied any number of times and in any order. Products of the
+    late confirmed payment are taken from stock again. Archived payments are changed too, but they don't belong to
+    the running totals of the current shift
+    :param statuses: Pairs of new status from bank and in database payment id
+    :return: New status, in database payment id and payer tg id of the really changed payments
+    """
+    base: sql.Connection = pool.connection
+    totals: List = []
+    taken: List = []
+    changed: List[Tuple[str, int, int]] = []
+    with base:
+        for status, payment_id in statuses:
+            payment: Tuple = ()
+            for table, products in PAYMENT_TABLES:
+                payment = base.execute(f"SELECT status, user_id FROM {table} WHERE id == ?", (payment_id,)).fetchone()
+                if payment:
+                    break
+            if not payment or status not in STATUS_TRANSITIONS.get(payment[0], ()):
+                continue
+            base.execute(f"UPDATE {table} SET status = ? WHERE id == ?", (status, payment_id))
+            changed.append((status, payment_id, payment[1]))
+            if status == "CONFIRMED" and payment[0] != "NEW":
+                logging.warning(ru.WRN_LATE_CONFIRMATION.format(payment_id, payment[0]))
+                taken += base.execute(
+                    "UPDATE product SET count = max(product.count - taken.count, 0) FROM ("
+                    f"  SELECT product, sum(count) AS count FROM {products} WHERE payment_id == ? GROUP BY product"
+                    ") AS taken WHERE product.name == taken.product RETURNING name",
+                    (payment_id,),
+                ).fetchall()
+            confirmed: int = (status == "CONFIRMED") - (payment[0] == "CONFIRMED")
+            if confirmed and table == "payment":
+                totals += base.execute(
+                    "INSERT INTO shift_totals(product, paid_count, total_price) "
+                    "SELECT product, ? * sum(count), ? * sum(count * price) FROM paid_product WHERE payment_id == ? "
+                    "GROUP BY product "
+                    "ON CONFLICT(product) DO UPDATE SET "
+                    "   paid_count = paid_count + excluded.paid_count, "
+                    "   total_price = total_price + excluded.total_price "
+                    "RETURNING product, paid_count, total_price",
+                    (confirmed, confirmed, payment_id),
+                ).fetchall()
+    if totals:
+        shift_totals.update(totals)
+    if taken:
+        menu_cache.invalidate(*(product[0] for product in taken))
+    return changed
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
 # Get requests to product database                                                                                     #
 # -------------------------------------------------------------------------------------------------------------------- #
-def get_menu(category: str, count: int = 0) -> List:
+@pool.reader
+def get_category(category: str) -> List:
     """
-    Requests product objects filtered by category
-    :return: Filtered menu
+    Requests all product objects of the category
+    :param category: Category's slug
+    :return: Category's products without carts, they are taken from the carts' mirror
     """
-    result: List = cur.execute(
-        "SELECT image, name, description, price, count FROM product WHERE category==? AND count>?",
-        (category, count),
+    result: List = pool.execute(
+        "SELECT image, name, description, price, count FROM product WHERE category == ?", (category,)
     ).fetchall()
     return result or []
 
 
-def get_product_fields() -> List:
+async def get_menu(category: str, count: int = 0, user_id: Union[int, str] = 0) -> List:
     """
-    Requests product fields
-    :return: Product fields
+    Requests product objects filtered by category with count of items ordered by other users. The category itself
+    comes from the menu cache and is requested from database only after changes of products, the carts come from
+    their mirror, so browsing and carts don't request database at all
+    :param category: Category's slug
+    :param count: Shows only products with the greater count
+    :param user_id: User's telegram id, his own preorder cart isn't counted as ordered
+    :return: Filtered menu
     """
-    return [name[0] for name in cur.execute("select * from product limit 1").description]
+    products: List = menu_cache.get(category)
+    if products is None:
+        generation: int = menu_cache.generation
+        products: List = await get_category(category)
+        menu_cache.put(category, products, generation)
+    cart: dict = carts.cart(user_id) if user_id else {}
+    return [
+        (*product, carts.reserved(product[1]) - cart.get(product[1], 0)) for product in products if product[4] > count
+    ]
 
 
+@pool.reader
 def check_product_name(name: str) -> int:
     """
     Checks product's name in product
     :param name: Product's name
     :return: 1 if product's name exists or 0 if not
     """
-    return cur.execute("SELECT count(*) FROM product WHERE name == ?", (name,)).fetchone()[0]
+    return pool.execute("SELECT count(*) FROM product WHERE name == ?", (name,)).fetchone()[0]
 
 
+@pool.reader
 def get_product(name: str) -> List:
     """
     Requests product object
     :param name: Object's name
     :return: Product data
     """
-    return cur.execute("SELECT * FROM product WHERE name == ?", (name,)).fetchone()
-
-
-def get_product_count(name: str) -> int:
-    """
-    Requests product object
-    :param name: Object's name
-    :return: Product data
-    """
-    return (cur.execute("SELECT count FROM product WHERE name == ?", (name,)).fetchone() or (0,))[0]
+    return pool.execute(f"SELECT {', '.join(PRODUCT_FIELDS)} FROM product WHERE name == ?", (name,)).fetchone()
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -279,34 +422,43 @@ def get_product_count(name: str) -> int:
 # -------------------------------------------------------------------------------------------------------------------- #
 # Change requests to product database                                                                                  #
 # -------------------------------------------------------------------------------------------------------------------- #
+@pool.writer
 def add_product(data: dict) -> int:
     """
     Adds menu's position
     :param data: Product's data
     :return: Added new position in menu
     """
-    if not check_product_name(data["name"]):
-        cur.execute("INSERT INTO product VALUES (?,?,?,?,?,?)", tuple(data.values()))
-        base.commit()
+    if not pool.execute("SELECT count(*) FROM product WHERE name == ?", (data["name"],)).fetchone()[0]:
+        pool.execute(
+            f"INSERT INTO product({', '.join(PRODUCT_FIELDS)}) VALUES (?,?,?,?,?,?)",
+            tuple(data[field] for field in PRODUCT_FIELDS),
+        )
+        pool.commit()
+        menu_cache.invalidate(categories=(data["category"],))
         return 0
-    else:
-        return update_product(data)
+    return _update_product(data)
 
 
-def update_product(data: dict) -> int:
+def _update_product(data: dict) -> int:
     """
     Updates menu's position
     :param data: Product's data
     :return: Updated a position in menu
     """
-    cur.execute(
+    pool.execute(
         "UPDATE product SET category = ?, image = ?, description = ?, price = ?, count = ? WHERE name == ?",
         (data["category"], data["image"], data["description"], data["price"], data["count"], data["name"]),
     )
-    base.commit()
+    pool.commit()
+    menu_cache.invalidate(data["name"], categories=(data["category"],))
     return 1
 
 
+update_product = pool.writer(_update_product)
+
+
+@pool.writer
 def update_product_count(count: int, name: str) -> None:
     """
     Updates product's count
@@ -314,28 +466,44 @@ def update_product_count(count: int, name: str) -> None:
     :param name: Name of product
     :return: Updated count of the position
     """
-    cur.execute("UPDATE product SET count = ? WHERE name == ?", (count, name))
-    base.commit()
+    pool.execute("UPDATE product SET count = ? WHERE name == ?", (count, name))
+    pool.commit()
+    menu_cache.invalidate(name)
 
 
-def sum_product_count(count: int, name: str) -> None:
+@pool.writer
+def restock_payments(payment_ids: Iterable[int]) -> int:
     """
-    Sum product's count
-    :param count: Product's count
-    :param name: Name of product
-    :return: Updated count of the position
+    Returns products of the unpaid payments to stock in one transaction: the counts are summed per product in SQL
+    :param payment_ids: Payment's ids in database
+    :return: Count of the items returned to stock
     """
-    cur.execute("UPDATE product SET count = count + ? WHERE name == ?", (count, name))
-    base.commit()
+    ids: str = json.dumps(list(payment_ids))
+    base: sql.Connection = pool.connection
+    with base:
+        items: Tuple = base.execute(
+            "SELECT total(count) FROM paid_product WHERE payment_id IN (SELECT value FROM json_each(?))", (ids,)
+        ).fetchone()
+        products: List = base.execute(
+            "UPDATE product SET count = product.count + returned.count FROM ("
+            "   SELECT product, sum(count) AS count FROM paid_product "
+            "   WHERE payment_id IN (SELECT value FROM json_each(?)) GROUP BY product"
+            ") AS returned WHERE product.name == returned.product RETURNING name",
+            (ids,),
+        ).fetchall()
+    menu_cache.invalidate(*(product[0] for product in products))
+    return int(items[0])
 
 
+@pool.writer
 def del_product(name: str) -> None:
     """
     Deletes position from menu database
     :return: Deleted position
     """
-    cur.execute("DELETE FROM product WHERE name == ?", (name,))
-    base.commit()
+    pool.execute("DELETE FROM product WHERE name == ?", (name,))
+    pool.commit()
+    menu_cache.invalidate(name)
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -343,73 +511,154 @@ def del_product(name: str) -> None:
 # -------------------------------------------------------------------------------------------------------------------- #
 # Get requests to payment database                                                                                     #
 # -------------------------------------------------------------------------------------------------------------------- #
+@pool.reader
 def get_user_payments(user_id: int) -> List:
     """
     Requests payments filtered by user's tg id
     :param user_id: User tg id
     :return: Filtered payments
     """
-    result: List = cur.execute(
-        "SELECT id, amount, date_time, status FROM payment WHERE user_id == ?", (user_id,)
+    result: List = pool.execute(
+        "SELECT id, amount, date_time, status FROM payment_archive WHERE user_id == ? "
+        "UNION ALL "
+        "SELECT id, amount, date_time, status FROM payment WHERE user_id == ?",
+        (user_id, user_id),
     ).fetchall()
     return result or []
 
 
-def get_in_time_payments(time_start: dt = None, time_finish: dt = dt.now()) -> List:
+def get_shift_start(now: dt) -> dt:
+    """
+    Calculates start time of the current shift
+    :param now: Any time inside the shift
+    :return: Start time of the shift
+    """
+    shift_start: dt = now.replace(hour=START_SHIFT[0], minute=START_SHIFT[1], second=0, microsecond=0)
+    return shift_start - td(days=1) if shift_start > now else shift_start
+
+
+def get_shift_window(time_start: dt = None, time_finish: dt = None) -> Tuple[float, float]:
+    """
+    Calculates time bounds for searching, by default from the start of the current shift till now
+    :param time_start: Start time for searching
+    :param time_finish: Finish time for searching
+    :return: Start and finish timestamps
+    """
+    time_finish: dt = time_finish or dt.now()
+    return (time_start or get_shift_start(time_finish)).timestamp(), time_finish.timestamp()
+
+
+@pool.reader
+def get_in_time_payments(time_start: dt = None, time_finish: dt = None) -> List:
     """
     Requests payments filtered by time
     :param time_start: Start time for searching
     :param time_finish: Finish time for searching
     :return: Filtered payments
     """
-    if not time_start:
-        time_start: dt = dt.now().replace(hour=START_SHIFT[0], minute=START_SHIFT[1], second=0, microsecond=0)
-        time_start: dt = time_start - td(days=1) if time_start > time_finish else time_start
-    result: List = cur.execute(
+    result: List = pool.execute(
         "SELECT id FROM payment WHERE status == 'CONFIRMED' AND date_time BETWEEN ? AND ?",
-        (time_start.timestamp(), time_finish.timestamp()),
+        get_shift_window(time_start, time_finish),
     ).fetchall()
     return result or []
 
 
+@pool.reader
 def get_payment_status(payment_id: Union[str, int]) -> str:
     """
     Requests payment status
     :param payment_id: Payment's id in database
     :return: Payment's status saved in database
     """
-    return cur.execute("SELECT status FROM payment WHERE id = ?", (payment_id,)).fetchone() or ""
+    result: Tuple = pool.execute(
+        "SELECT status FROM payment WHERE id == ? UNION ALL SELECT status FROM payment_archive WHERE id == ?",
+        (payment_id, payment_id),
+    ).fetchone()
+    return (result or ("",))[0]
 
 
+@pool.reader
 def get_paid_products(payment_id: Union[int, str]) -> List:
     """
     Requests paid products filtered by id
     :param payment_id: Payment's id
     :return: Filtered orders
     """
-    result: List = cur.execute(
-        "SELECT product, count FROM paid_product WHERE payment_id == ?", (payment_id,)
+    result: List = pool.execute(
+        "SELECT product, count FROM paid_product WHERE payment_id == ? "
+        "UNION ALL "
+        "SELECT product, count FROM paid_product_archive WHERE payment_id == ?",
+        (payment_id, payment_id),
     ).fetchall()
     return result or []
 
 
-def get_report(payment_ids: Tuple, in_order: bool = True) -> List:
+@pool.reader
+def get_report(in_order: bool = True, time_start: dt = None, time_finish: dt = None) -> List:
     """
-    Request report data by payment's ids
-    :param payment_ids: List of payment's ids
+    Request report data of confirmed payments filtered by time
     :param in_order: Adds in order products for a report
-    :return: List of paid and pre-ordered (optional) products
-    """
-    if payment_ids:
-        payment_filter: str = f"IN {payment_ids}" if len(payment_ids) > 1 else f"== {payment_ids[0]}"
-        paid: str = f"SELECT product, count, price, 0 FROM paid_product WHERE payment_id {payment_filter}              "
-        ordered: str = (
-            "UNION                                                                                                     "
-            "SELECT product, 0, 0, count FROM pre_order WHERE count > 0                                                "
-        )
-        return cur.execute(paid + ordered if in_order else paid).fetchall() or []
+    :param time_start: Start time for searching
+    :param time_finish: Finish time for searching
+    :return: List of products with paid count, total price and pre-ordered count
+    """
+    result: List = pool.execute(
+        "SELECT product, sum(paid_count), sum(total_price), sum(order_count) FROM ("
+        "   SELECT pp.product AS product, pp.count AS paid_count, pp.count * pp.price AS total_price, 0 AS order_count"
+        "   FROM payment AS p INNER JOIN paid_product AS pp ON pp.payment_id = p.id "
+        "   WHERE p.status == 'CONFIRMED' AND p.date_time BETWEEN ? AND ? "
+        "   UNION ALL "
+        "   SELECT name, 0, 0, reserved FROM product WHERE reserved > 0 AND ? "
+        ") GROUP BY product ORDER BY product",
+        (*get_shift_window(time_start, time_finish), in_order),
+    ).fetchall()
+    return result or []
+
+
+@pool.reader
+def get_reserved() -> List:
+    """
+    Requests products in preorder carts
+    :return: Product's names and count of items in carts
+    """
+    return pool.execute("SELECT name, reserved FROM product WHERE reserved > 0 ORDER BY name").fetchall() or []
+
+
+@pool.reader
+def get_shift_totals() -> List:
+    """
+    Requests saved running totals of the shift
+    :return: Product's name, paid count and total price
+    """
+    return pool.execute("SELECT product, paid_count, total_price FROM shift_totals").fetchall() or []
+
+
+@pool.writer
+def reset_shift_totals(rows: Iterable[Tuple[str, int, float]] = ()) -> None:
+    """
+    Replaces running totals of the shift
+    :param rows: Product's name, paid count and total price
+    :return: New running totals
+    """
+    rows: List = list(rows)
+    base: sql.Connection = pool.connection
+    with base:
+        base.execute("DELETE FROM shift_totals")
+        base.executemany("INSERT INTO shift_totals(product, paid_count, total_price) VALUES (?,?,?)", rows)
+    shift_totals.reset(rows)
+
+
+async def load_shift_totals() -> None:
+    """
+    Loads running totals of the shift into memory, an empty table is filled from paid products of the shift
+    :return: Loaded running totals
+    """
+    rows: List = await get_shift_totals()
+    if rows:
+        shift_totals.reset(rows)
     else:
-        return []
+        await reset_shift_totals(report[:3] for report in await get_report(in_order=False))
+
 
 # -------------------------------------------------------------------------------------------------------------------- #
 
@@ -417,69 +666,247 @@ def get_report(payment_ids: Tuple, in_order: bool = True) -> List:
 # -------------------------------------------------------------------------------------------------------------------- #
 # Change requests to paid_product database                                                                          #
 # -------------------------------------------------------------------------------------------------------------------- #
-def create_payment(user_id: Union[str, int], amount: float) -> int:
+@pool.writer
+def checkout(user_id: Union[str, int]) -> Tuple[int, float]:
     """
-    Create payment object in database if not exists
+    Moves user's cart into payment in a single transaction: creates payment or appends to the user's new payment of
+    the shift, whose link hasn't been got yet, fills its product's list, takes products from stock, clears the cart
+    and queues the bank's payment initialization into the outbox. The payment with a link is never changed, since the
+    payer may have already paid it
     :param user_id: Payer tg id
-    :param amount: Total price
-    :return: ID of created or existed payment
-    """
-    now: dt = dt.now()
-    day_start: dt = now.replace(hour=START_SHIFT[0], minute=START_SHIFT[1], second=0, microsecond=0)
-    day_start: float = (day_start - td(days=1) if day_start > now else day_start).timestamp()
-    exist: int = cur.execute(
-        "SELECT COUNT(*) FROM payment WHERE status == 'NEW' AND user_id == ? AND date_time >= ?", (user_id, day_start)
-    ).fetchone()[0]
-    if not exist:
-        cur.execute("INSERT INTO payment(date_time, user_id, amount) VALUES(?,?,?)", (now.timestamp(), user_id, amount))
-        base.commit()
-    return cur.execute(
-        "SELECT id FROM payment WHERE status == 'NEW' AND user_id == ? AND date_time >= ?", (user_id, day_start)
-    ).fetchone()[0]
-
-
-def update_payment_id(payment_id: Union[int, str], self_id: Union[int, str]) -> None:
-    """
-    Update payment id in payment database
+    :return: ID and amount of the payment or (0, 0.0) if the cart is empty
+    """
+    base: sql.Connection = pool.connection
+    with base:
+        orders: List = base.execute(
+            "SELECT p.name, p.price, po.count "
+            "FROM product as p INNER JOIN pre_order as po ON p.name = po.product "
+            "WHERE po.count > 0 AND po.user_id == ?",
+            (user_id,),
+        ).fetchall()
+        if not orders:
+            return 0, 0.0
+        now: dt = dt.now()
+        amount: float = sum(order[1] * order[2] for order in orders)
+        payment: Tuple = base.execute(
+            "UPDATE payment SET amount = amount + ? WHERE id == ("
+            "   SELECT id FROM payment "
+            "   WHERE status == 'NEW' AND payment_id IS NULL AND user_id == ? AND date_time >= ? LIMIT 1"
+            ") RETURNING id, amount",
+            (amount, user_id, get_shift_start(now).timestamp()),
+        ).fetchone() or base.execute(
+            "INSERT INTO payment(id, date_time, user_id, amount) VALUES(("
+            "   SELECT coalesce(max(id), 0) + 1 FROM ("
+            "       SELECT max(id) AS id FROM payment UNION ALL SELECT max(id) FROM payment_archive"
+            "   )"
+            "),?,?,?) RETURNING id, amount",
+            (now.timestamp(), user_id, amount),
+        ).fetchone()
+        base.executemany(
+            "INSERT INTO paid_product(payment_id, product, price, count) VALUES(?,?,?,?)",
+            ((payment[0], *order) for order in orders),
+        )
+        base.executemany(
+            "UPDATE product SET count = count - ? WHERE name == ?", ((order[2], order[0]) for order in orders)
+        )
+        base.execute("UPDATE pre_order SET count = 0 WHERE user_id == ?", (user_id,))
+        base.execute(OUTBOX_INSERT, ("init", payment[0], f"init:{payment[0]}", now.timestamp()))
+    carts.empty(user_id)
+    menu_cache.invalidate(*(order[0] for order in orders))
+    return payment[0], float(payment[1])
+
+
+@pool.writer
+def update_payment_id(
+    payment_id: Union[int, str], self_id: Union[int, str], amount: float, payment_url: str = ""
+) -> bool:
+    """
+    Update payment id and link in payment database, unless the payment has got another amount or a link meanwhile
     :param self_id: Payment id in database
     :param payment_id: Payment id in bank
-    :return: Updated payment id
+    :param amount: Amount of the bank's payment
+    :param payment_url: Link to the payment, which is sent to the payer
+    :return: True if the payment id is updated
     """
-    cur.execute("UPDATE payment SET payment_id = ? WHERE id == ?", (payment_id, self_id))
-    base.commit()
+    updated: int = pool.execute(
+        "UPDATE payment SET payment_id = ?, payment_url = ? WHERE id == ? AND amount == ? AND payment_id IS NULL",
+        (payment_id, payment_url, self_id, amount),
+    ).rowcount
+    pool.commit()
+    return updated > 0
 
 
-def make_payment_list(payment_id: int, product: str, price: float, count: int) -> None:
+@pool.reader
+def get_payment_link(payment_id: Union[int, str]) -> Tuple[str, bool]:
     """
-    Makes product's list of payment
-    :param payment_id: In database payment's id
-    :param product: Product's name
-    :param price: Product's price
-    :param count: Product's order count
-    :return: Added products to payment's list
+    Requests the link of the payment
+    :param payment_id: Payment id in database
+    :return: Link to the payment and whether it has been sent to the payer
     """
-    cur.execute(
-        "INSERT INTO paid_product(payment_id, product, price, count) VALUES(?,?,?,?)",
-        (payment_id, product, price, count),
-    )
-    base.commit()
+    link: Tuple = pool.execute("SELECT payment_url, link_sent FROM payment WHERE id == ?", (payment_id,)).fetchone()
+    return (link[0] or "", bool(link[1])) if link else ("", False)
+
+
+@pool.writer
+def mark_link_sent(payment_id: Union[int, str]) -> None:
+    """
+    Marks the link of the payment as sent to the payer
+    :param payment_id: Payment id in database
+    :return: Marked payment
+    """
+    pool.execute("UPDATE payment SET link_sent = 1 WHERE id == ?", (payment_id,))
+    pool.commit()
 
 
+@pool.reader
 def get_new_payments() -> List:
     """
-    Finds ids of payments with status "New"
-    :return: New payment's ids
+    Finds payments with status "New", which have got the bank's payment id
+    :return: New payment's ids, bank's payment ids, user ids and creation times
+    """
+    return (
+        pool.execute(
+            "SELECT id, payment_id, user_id, date_time FROM payment WHERE status == 'NEW' AND payment_id IS NOT NULL"
+        ).fetchall()
+        or []
+    )
+
+
+@pool.writer
+def add_short_link(url: str) -> str:
+    """
+    Saves the url under a new random code
+    :param url: Url to shorten
+    :return: Code of the short link
+    """
+    while True:
+        code: str = token_urlsafe(6)
+        if pool.execute("INSERT OR IGNORE INTO short_link VALUES(?,?,?)", (code, url, dt.now().timestamp())).rowcount:
+            pool.commit()
+            link_cache.put(code, url)
+            return code
+
+
+async def get_short_link(code: str) -> str:
+    """
+    Finds the url of the short link, the fresh links are served from cache
+    :param code: Code of the short link
+    :return: Url or empty string
     """
-    return cur.execute("SELECT id, payment_id, user_id FROM payment WHERE status == 'NEW'").fetchall() or []
+    url: Union[str, None] = link_cache.get(code)
+    if url is None:
+        url = await find_short_link(code)
+        if url:
+            link_cache.put(code, url)
+    return url
 
 
-def expire_old_payments() -> List:
+@pool.reader
+def find_short_link(code: str) -> str:
     """
-    Finds and expires old orders
+    Finds the url of the short link in database
+    :param code: Code of the short link
+    :return: Url or empty string
+    """
+    link: Tuple = pool.execute("SELECT url FROM short_link WHERE code == ?", (code,)).fetchone()
+    return link[0] if link else ""
+
+
+@pool.reader
+def get_payment(payment_id: Union[str, int]) -> Tuple:
+    """
+    Requests the payment in the current shift
+    :param payment_id: Payment's id in database
+    :return: Payer tg id, bank's payment id, amount and status or empty tuple
+    """
+    payment: Tuple = pool.execute(
+        "SELECT user_id, payment_id, amount, status FROM payment WHERE id == ?", (payment_id,)
+    ).fetchone()
+    return payment or ()
+
+
+@pool.writer
+def add_operation(operation: str, payment_id: int, key: str) -> None:
+    """
+    Queues the bank's operation into the outbox
+    :param operation: "init" or "cancel"
+    :param payment_id: Payment's id in database or bank's payment id for "cancel"
+    :param key: Idempotency key: operation with the same key is done once
+    :return: Queued operation
+    """
+    pool.execute(OUTBOX_INSERT, (operation, payment_id, key, dt.now().timestamp()))
+    pool.commit()
+
+
+@pool.reader
+def get_due_operations(now: float, limit: int) -> Tuple[List, float]:
+    """
+    Requests the outbox operations, whose time has come
+    :param now: Current time (timestamp)
+    :param limit: Maximum count of operations
+    :return: Id, operation, payment id, attempts and due time of the due operations and due time of the next one or 0
+    """
+    operations: List = pool.execute(
+        "SELECT id, operation, payment_id, attempts, due FROM outbox WHERE due <= ? ORDER BY due LIMIT ?",
+        (now, limit),
+    ).fetchall()
+    following: Tuple = pool.execute("SELECT min(due) FROM outbox WHERE due > ?", (now,)).fetchone()
+    return operations, following[0] or 0
+
+
+@pool.writer
+def finish_operation(operation_id: int, due: float) -> None:
+    """
+    Removes the done or abandoned operation from the outbox, unless it has been queued again meanwhile
+    :param operation_id: Operation's id in the outbox
+    :param due: Due time of the done operation
+    :return: Removed operation
+    """
+    pool.execute("DELETE FROM outbox WHERE id == ? AND due == ?", (operation_id, due))
+    pool.commit()
+
+
+@pool.writer
+def postpone_operation(operation_id: int, due: float, next_due: float) -> None:
+    """
+    Counts the failed attempt and postpones the operation, unless it has been queued again meanwhile
+    :param operation_id: Operation's id in the outbox
+    :param due: Due time of the failed operation
+    :param next_due: Time of the next attempt (timestamp)
+    :return: Postponed operation
+    """
+    pool.execute(
+        "UPDATE outbox SET attempts = attempts + 1, due = ? WHERE id == ? AND due == ?", (next_due, operation_id, due)
+    )
+    pool.commit()
+
+
+@pool.reader
+def find_payment(bank_payment_id: Union[int, str]) -> int:
+    """
+    Finds the payment of the current shift or the archived one by the bank's payment id
+    :param bank_payment_id: Bank's payment id
+    :return: In database payment id or 0
+    """
+    payment: Tuple = pool.execute(
+        "SELECT id FROM payment WHERE payment_id == ? UNION ALL SELECT id FROM payment_archive WHERE payment_id == ?",
+        (bank_payment_id, bank_payment_id),
+    ).fetchone()
+    return payment[0] if payment else 0
+
+
+@pool.writer
+def expire_old_payments(payment_ids: Iterable[int]) -> List:
+    """
+    Expires the old orders, which are still new after the last poll
+    :param payment_ids: Payment's ids in database
     :return: Expired orders
     """
-    old: float = (dt.now() - td(days=1)).timestamp()
-    result: List = cur.execute("SELECT id FROM payment WHERE status == 'NEW' AND date_time < ?", (old,)).fetchall()
-    cur.execute("UPDATE payment SET status='EXPIRED' WHERE status == 'NEW' AND date_time < ?", (old,))
-    base.commit()
+    old: float = (dt.now() - td(seconds=STATE_PAYMENT_LIFETIME)).timestamp()
+    result: List = pool.execute(
+        "UPDATE payment SET status = 'EXPIRED' "
+        "WHERE status == 'NEW' AND date_time < ? AND id IN (SELECT value FROM json_each(?)) RETURNING id",
+        (old, json.dumps(list(payment_ids))),
+    ).fetchall()
+    pool.commit()
     return [payment[0] for payment in result]
@@ -4,6 +4,7 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.dispatcher.filters import Text
 
 from core.config import ADMINS
+from core.create import router
 from core.messanger import respond
 from database import sql_db
 from handlers.base import (
@@ -123,7 +124,7 @@ async def set_name(message: Message, state: FSMContext) -> None:
     if message.from_user.id in ADMINS:
         name: str = message.text
         if name != "-":
-            if sql_db.check_product_name(name):
+            if await sql_db.check_product_name(name):
                 await message.reply(ru.ERR_NAME_EXISTS)
                 return
             if len(name) > 25:
@@ -264,18 +265,18 @@ async def choose_change_position(message: Message, state: FSMContext) -> None:
         await state.finish()
 
 
-async def change_position(query: CallbackQuery, state: FSMContext = None) -> None:
+async def change_position(query: CallbackQuery, name: str, state: FSMContext = None) -> None:
     """
     Delete dish from menu database
     :param query: Aiogram query object
+    :param name: Product's name
     :param state: Aiogram FSMContext
     :return: Deleted dish from menu
     """
     if query.from_user.id in ADMINS:
-        name: str = query.data.replace("change ", "")
         await FSMAdd.category.set()
         async with state.proxy() as data:
-            data.update(dict(zip(sql_db.get_product_fields(), sql_db.get_product(name))))
+            data.update(dict(zip(sql_db.PRODUCT_FIELDS, await sql_db.get_product(name))))
         await respond(query, ru.MSG_ADMIN_CHANGE_CATEGORY, add_kb)
 
 
@@ -314,14 +315,14 @@ async def choose_del_position(message: Message, state: FSMContext) -> None:
         await state.finish()
 
 
-async def ask_del_confirmation(query: CallbackQuery) -> None:
+async def ask_del_confirmation(query: CallbackQuery, name: str) -> None:
     """
     Asks confirmation to delete a dish from menu database
     :param query: Aiogram query object
+    :param name: Product's name
     :return: Asked confirmation
     """
     if query.from_user.id in ADMINS:
-        name: str = query.data.replace("del ", "")
         markup = make_inline_buttons(
             (ru.NLN_CONFIRM, ru.NLN_CANCEL),
             (f"conf_adm_del{name}", f"decl_adm_del{name}"),
@@ -329,9 +330,8 @@ async def ask_del_confirmation(query: CallbackQuery) -> None:
         await respond(query, ru.MSG_ADMIN_CONFIRM.format(name), markup, del_msg=False)
 
 
-async def del_position(query: CallbackQuery) -> None:
-    if query.from_user.id in ADMINS and query.data.startswith("conf_adm_del"):
-        name: str = query.data.replace("conf_adm_del", "")
+async def del_position(query: CallbackQuery, name: str, confirmed: bool) -> None:
+    if query.from_user.id in ADMINS and confirmed:
         await delete_position(name, query)
     else:
         await respond(query, ru.MSG_ADMIN_CANCELED, upd_menu_kb)
@@ -380,9 +380,9 @@ def reg_admin_menu_handlers(dp: Dispatcher) -> None:
     dp.register_message_handler(set_price, state=FSMAdd.price)
     dp.register_message_handler(set_count, state=FSMAdd.count)
     dp.register_message_handler(choose_del_position, state=FSMDel.category)
-    dp.register_callback_query_handler(ask_del_confirmation, lambda q: q.data and q.data.startswith("del "))
-    dp.register_callback_query_handler(del_position, lambda q: q.data and q.data.startswith("conf_adm_del"))
-    dp.register_callback_query_handler(del_position, lambda q: q.data and q.data.startswith("decl_adm_del"))
+    router.add("del ", ask_del_confirmation, str)
+    router.add("conf_adm_del", del_position, str, confirmed=True)
+    router.add("decl_adm_del", del_position, str, confirmed=False)
     dp.register_message_handler(choose_change_position, state=FSMCng.category)
-    dp.register_callback_query_handler(change_position, lambda q: q.data and q.data.startswith("change "))
+    router.add("change ", change_position, str)
     dp.register_message_handler(test, Text(equals="test", ignore_case=True))
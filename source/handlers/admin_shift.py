@@ -1,3 +1,4 @@
+import logging
 import openpyxl
 from aiogram import Dispatcher
 from aiogram.dispatcher import FSMContext
@@ -6,10 +7,12 @@ from aiogram.dispatcher.filters import Text
 from datetime import datetime as dt
 
 from core.config import ADMINS, TEMP
-from core.messanger import respond, respond_file
+from core.create import deleter, router, sender
+from core.messanger import delete_later, escape_markdown, respond, respond_file, respond_lines
 from database import sql_db
 from handlers.admin_menu import check_admin
-from handlers.base import LEVEL, FSMFindPayment, make_report, get_payment_products
+from handlers.base import LEVEL, FSMFindPayment, make_report, make_closing_report, get_payment_products
+from handlers.payment import sweep_stats
 from localization import ru
 from keyboards.admin_kb import back_kb, shift_kb
 from keyboards.base_kb import make_inline_buttons
@@ -34,23 +37,11 @@ async def get_report(message: Message) -> None:
     :return: Shown menu's updating keyboard
     """
     if message.from_user.id in ADMINS:
-        orders: dict = make_report()
-        length: int = 0
-        responses: list = [[]]
-        revenue: float = 0.0
-        in_order: int = 0
-        for order, data in orders.items():
-            revenue += data["total_price"]
-            in_order += data["order_count"]
-            reported_dish: str = ru.MSG_ADMIN_REPORT.format(order, *data.values())
-            length += len(reported_dish) + 1
-            if length > 500:
-                length: int = len(reported_dish) + 1
-                responses.append([])
-            responses[-1].append(reported_dish)
-        for response in responses:
-            await respond(message, "\n".join(response), del_msg=False)
-        await respond(message, ru.MSG_ADMIN_REVENUE.format(revenue, in_order))
+        orders: list = await make_report()
+        revenue: float = sum(order[2] for order in orders)
+        in_order: int = sum(order[3] for order in orders)
+        lines: list = [ru.MSG_ADMIN_REPORT.format(escape_markdown(order[0]), *order[1:]) for order in orders]
+        await respond_lines(message, [*lines, ru.MSG_ADMIN_REVENUE.format(revenue, in_order)])
 
 
 async def ask_payment_to_find(message: Message, state: FSMContext = None) -> None:
@@ -79,10 +70,13 @@ async def find_payment(message: Message, state: FSMContext) -> None:
             await message.reply(ru.ERR_NOT_NUM, reply_markup=back_kb)
             return
         await state.finish()
-        payment_products: bool = await get_payment_products(message, payment_id)
-        if not payment_products:
+        payment_products: list = await get_payment_products(payment_id)
+        if payment_products:
+            await respond_lines(message, payment_products, del_msg=False)
+        else:
             await respond(message, ru.MSG_ADMIN_NO_PAYMENT, shift_kb)
-        payment_status: str = ru.PAYMENT_STATUS.get(sql_db.get_payment_status(payment_id), ru.UNKNOWN_STATUS)
+        status: str = await sql_db.get_payment_status(payment_id)
+        payment_status: str = ru.PAYMENT_STATUS.get(status, ru.UNKNOWN_STATUS)
         await respond(message, ru.MSG_ADMIN_PAYMENT_STATUS.format(payment_status), del_msg=False)
     else:
         await state.finish()
@@ -94,17 +88,18 @@ async def show_payment_products(message: Message) -> None:
     :param message: Aiogram message object
     :return: Shown payment's products
     """
-    payments: tuple = tuple(payment[0] for payment in sql_db.get_in_time_payments())
-    for payment in payments:
-        await get_payment_products(message, payment)
-    if not payments:
+    in_time_payments: list = await sql_db.get_in_time_payments()
+    lines: list = []
+    for payment in in_time_payments:
+        lines.extend(await get_payment_products(payment[0]))
+    if not lines:
         await respond(message, ru.MSG_NO_ORDERS)
     else:
-        await message.delete()
+        await respond_lines(message, lines)
 
 
 async def empty_buttons(message: Message) -> None:
-    await message.delete()
+    delete_later(message)
 
 
 async def ask_close_shift(message: Message) -> None:
@@ -118,33 +113,41 @@ async def ask_close_shift(message: Message) -> None:
         await respond(message, ru.MSG_ADMIN_CLOSE_SHIFT, markup)
 
 
-async def close_shift(query: CallbackQuery) -> None:
+async def close_shift(query: CallbackQuery, confirmed: bool) -> None:
     """
     Create and send report and close shift
     :param query: Aiogram Callback query
+    :param confirmed: True if the admin has confirmed closing
     :return: Closed shift and sent report
     """
     if query.from_user.id in ADMINS:
-        if query.data == "confirm_close_shift":
+        if confirmed:
             wb = openpyxl.Workbook()
             wb_list = wb.active
-            orders: dict = make_report(in_order=False)
+            orders: list = await make_closing_report()
             total_price: float = 0.0
             wb_list.append(ru.XLSX_TABLE_TITLES)
-            for product, data in orders.items():
-                if data["paid_count"] > 0:
-                    wb_list.append((product, data["paid_count"], data["total_price"]))
-                    total_price += data["total_price"]
+            for order in orders:
+                wb_list.append(order)
+                total_price += order[2]
             wb_list.append(("", ru.XLSX_TABLE_CONCLUSION.format(dt.now().strftime("%D")), total_price))
             file_name: str = f"{dt.now().strftime('%d-%m-%y %H.%M')}.xlsx"
             wb.save(TEMP / file_name)
-            sql_db.close_orders()
+            await sql_db.close_orders()
+            await sql_db.reset_shift_totals()
+            logging.info(ru.INF_SHIFT_ARCHIVED.format(await sql_db.archive_shift()))
+            logging.info(ru.INF_MENU_CACHE_STATS.format(**sql_db.menu_cache.stats))
+            logging.info(ru.INF_SENDER_STATS.format(depth=sender.depth, **sender.stats, **deleter.stats))
+            logging.info(ru.INF_PAYMENT_SWEEP_STATS.format(**sweep_stats))
+            sweep_stats.update(sweeps=0, max_duration=0.0, max_lag=0.0)
+            for prefix, stats in router.stats.items():
+                logging.info(ru.INF_ROUTE_STATS.format(prefix.strip(), **stats))
             await respond_file(query, TEMP / file_name, del_msg=False)
             await respond(query, ru.MSG_ADMIN_SHIFT_CLOSED.format(file_name))
         else:
             await respond(query, ru.MSG_ADMIN_CANCELED)
     else:
-        await query.message.delete()
+        delete_later(query)
 
 
 def reg_admin_shift_handlers(dp: Dispatcher) -> None:
@@ -160,6 +163,5 @@ def reg_admin_shift_handlers(dp: Dispatcher) -> None:
     dp.register_message_handler(ask_close_shift, Text(equals=ru.CMD_ADMIN_CLS_SHIFT, ignore_case=True))
     dp.register_message_handler(show_payment_products, Text(equals=ru.CMD_SHOW_PAID, ignore_case=True))
     dp.register_message_handler(empty_buttons, Text(equals=[">", "<"]))
-    dp.register_callback_query_handler(
-        close_shift, lambda q: q.data and (q.data == "confirm_close_shift" or q.data == "decline_close_shift")
-    )
+    router.add("confirm_close_shift", close_shift, confirmed=True)
+    router.add("decline_close_shift", close_shift, confirmed=False)
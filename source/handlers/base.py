@@ -1,15 +1,19 @@
 import logging
 
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InputMediaPhoto
+from aiogram.utils.exceptions import MessageNotModified
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from asyncio import run, sleep
 from typing import Union, List, Dict, Tuple
 
-from core.messanger import respond, respond_with_photo
+from core.config import ALBUM_SIZE, CAROUSEL_SNAPSHOTS, MENU_MODE, MENU_ROW_WIDTH, RENDER_CACHE, USERS_FLUSH_PERIOD
+from core.messanger import escape_markdown, respond, respond_with_album, respond_with_photo
 from database import sql_db
+from database.cache import LruCache
 from localization import ru
 from keyboards.admin_kb import back_kb
-from keyboards.base_kb import make_inline_buttons
+from keyboards.base_kb import get_inline_buttons, make_carousel_buttons
 
 
 class LevelControl:
@@ -82,14 +86,24 @@ def check_user_registration(tg_id) -> None:
     :param tg_id: User's telegram id
     :return: Registered user
     """
-    if not sql_db.check_user(tg_id):
+    if sql_db.check_user(tg_id):
         logging.info(ru.INF_REGISTER_USER.format(tg_id))
+
+
+async def save_new_users() -> None:
+    """
+    Periodically saves new users into database
+    :return: Saved users
+    """
+    while True:
+        await sleep(USERS_FLUSH_PERIOD)
         try:
-            sql_db.add_user(tg_id)
+            users: set = await sql_db.flush_users()
         except Exception as exc:
             logging.error(exc)
         else:
-            logging.info(ru.INF_USER_REGISTERED.format(tg_id))
+            for user in users:
+                logging.info(ru.INF_USER_REGISTERED.format(user))
 
 
 async def check_category(message: Message) -> str:
@@ -116,7 +130,7 @@ async def check_menu(message: Message, category: str, state: FSMContext) -> List
     """
     if category:
         await state.finish()
-        menu: List = sql_db.get_menu(category, count=-1)
+        menu: List = await sql_db.get_menu(category, count=-1)
         if menu:
             return menu
         await respond(message, ru.MSG_MENU_EMPTY, back_kb)
@@ -132,10 +146,10 @@ async def delete_position(name: str, message: Union[Message, CallbackQuery]) ->
     """
     logging.info(ru.INF_POSITION_START_DEL.format(name))
     try:
-        sql_db.del_product(name)
+        await sql_db.del_product(name)
     except Exception as exc:
         logging.error(exc)
-    if sql_db.check_product_name(name):
+    if await sql_db.check_product_name(name):
         await respond(message, text=ru.ERR_ADMIN_NOT_DELETED.format(name))
     else:
         logging.info(ru.MSG_ADMIN_DELETED.format(name))
@@ -153,7 +167,7 @@ async def change_or_create_position(data: Dict, message: Message, old_name: str
     name = data["name"]
     logging.info(ru.INF_POSITION_START_ADD.format(name))
     try:
-        changed: int = sql_db.add_product(data)
+        changed: int = await sql_db.add_product(data)
     except Exception as exc:
         logging.error(exc)
         await respond(message, ru.ERR_ADMIN_CANT_ADD.format(name), del_msg=False)
@@ -166,6 +180,32 @@ async def change_or_create_position(data: Dict, message: Message, old_name: str
             await respond(message, ru.MSG_ADMIN_ADDED.format(name), del_msg=False)
 
 
+def get_dish_card(dish: Tuple) -> Tuple[str, str]:
+    """
+    Finds dish's caption rendered without the count. The card is keyed by the name, description and price, so the card
+    of the changed product is rendered again and the old one is forgotten by the cache
+    :param dish: Product's data
+    :return: Caption's parts before and after the count
+    """
+    card: Tuple[str, str] = cards.get(dish[1:4])
+    if card is None:
+        card = tuple(ru.MSG_DISH.format(*dish[1:4], "\0").split("\0"))
+        cards.put(dish[1:4], card)
+    return card
+
+
+def get_dish_caption(dish: Tuple, admin: bool = False) -> str:
+    """
+    Makes dish's caption
+    :param dish: Product's data
+    :param admin: If not admin shows count without ordered products
+    :return: Caption of the dish
+    """
+    if not admin:
+        return str(dish[4] - dish[5]).join(get_dish_card(dish))
+    return " ".join((str(dish[4]).join(get_dish_card(dish)), ru.MSG_IN_ORDERS.format(dish[5])))
+
+
 async def show_menu(menu: List, message: Message, button: str, callback: str, admin: bool = False) -> None:
     """
     Shows menu and inline button
@@ -176,14 +216,78 @@ async def show_menu(menu: List, message: Message, button: str, callback: str, ad
     :param admin: If not admin shows count without ordered products
     :return: Shown menu with inline buttons
     """
+    if MENU_MODE == "album":
+        await show_menu_albums(menu, message, button, callback, admin)
+        return
+    if MENU_MODE == "carousel":
+        await show_menu_carousel(menu, message, button, callback, admin)
+        return
     for dish in menu:
         name: str = dish[1]
-        if not admin:
-            text: str = ru.MSG_DISH.format(*dish[1:-1], dish[-1] - sql_db.get_ordered(name, message.from_user.id))
-        else:
-            text: str = " ".join((ru.MSG_DISH.format(*dish[1:]), ru.MSG_IN_ORDERS.format(sql_db.get_ordered(name, 0))))
-        markup = make_inline_buttons((button.format(name),), (callback.format(name),))
-        await respond_with_photo(message, dish[0], text, markup, del_msg=False)
+        markup: str = get_inline_buttons((button.format(name),), (callback.format(name),))
+        await respond_with_photo(message, dish[0], get_dish_caption(dish, admin), markup, del_msg=False)
+
+
+async def show_menu_albums(menu: List, message: Message, button: str, callback: str, admin: bool = False) -> None:
+    """
+    Shows menu as albums of up to 10 dishes and one inline keyboard with buttons of all dishes
+    :param menu: List of products data
+    :param message: Aiogram message object
+    :param button: Button's message
+    :param callback: Query callback
+    :param admin: If not admin shows count without ordered products
+    :return: Shown menu with inline buttons
+    """
+    size: int = -(-len(menu) // -(-len(menu) // ALBUM_SIZE))  # even albums: 11 dishes are 6 + 5, not 10 + 1
+    for start in range(0, len(menu), size):
+        album: List = menu[start : start + size]
+        if len(album) == 1:
+            await respond_with_photo(message, album[0][0], get_dish_caption(album[0], admin), del_msg=False)
+            continue
+        media: List = [InputMediaPhoto(dish[0], get_dish_caption(dish, admin), parse_mode="Markdown") for dish in album]
+        await respond_with_album(message, media, del_msg=False)
+    buttons: Tuple = tuple(button.format(dish[1]) for dish in menu)
+    callbacks: Tuple = tuple(callback.format(dish[1]) for dish in menu)
+    await respond(message, ru.MSG_MENU_BUTTONS, get_inline_buttons(buttons, callbacks, MENU_ROW_WIDTH), del_msg=False)
+
+
+async def show_menu_carousel(menu: List, message: Message, button: str, callback: str, admin: bool = False) -> None:
+    """
+    Shows the first dish of menu in one message, which pages through the menu's snapshot with inline buttons
+    :param menu: List of products data
+    :param message: Aiogram message object
+    :param button: Button's message
+    :param callback: Query callback
+    :param admin: If not admin shows count without ordered products
+    :return: Shown dish with paging buttons
+    """
+    markup = make_carousel_buttons(0, len(menu), button.format(menu[0][1]), callback.format(menu[0][1]))
+    response: Message = await respond_with_photo(message, menu[0][0], get_dish_caption(menu[0], admin), markup, False)
+    if response:
+        carousel.put((response.chat.id, response.message_id), (menu, button, callback, admin))
+
+
+async def turn_menu_page(query: CallbackQuery, page: int) -> None:
+    """
+    Shows another dish of the menu's snapshot in the same message
+    :param query: Aiogram CallbackQuery object
+    :param page: Index of the dish to show
+    :return: Edited message with the dish
+    """
+    snapshot: Tuple = carousel.get((query.message.chat.id, query.message.message_id))
+    if not snapshot:
+        await query.answer(ru.ERR_MENU_OUTDATED)
+        return
+    menu, button, callback, admin = snapshot
+    index: int = page % len(menu)
+    dish: Tuple = menu[index]
+    markup = make_carousel_buttons(index, len(menu), button.format(dish[1]), callback.format(dish[1]))
+    media = InputMediaPhoto(dish[0], get_dish_caption(dish, admin), parse_mode="Markdown")
+    try:
+        await query.message.edit_media(media, markup)
+    except MessageNotModified:
+        pass
+    await query.answer()
 
 
 async def show_orders(orders: List, message: Message, buttons: Tuple, callbacks: Tuple) -> float:
@@ -198,61 +302,55 @@ async def show_orders(orders: List, message: Message, buttons: Tuple, callbacks:
     total: float = 0.0
     for order in orders:
         name: str = order[1]
-        markup = make_inline_buttons(
+        markup: str = get_inline_buttons(
             (buttons[0].format(name), buttons[1].format(name)), (callbacks[0].format(name), callbacks[1].format(name))
         )
         price: float = order[-1] * order[-2]
         total += price
-        text: str = " ".join((ru.MSG_DISH.format(*order[1:]), ru.MSG_PRICE.format(price)))
+        text: str = " ".join((str(order[4]).join(get_dish_card(order)), ru.MSG_PRICE.format(price)))
         await respond_with_photo(message, order[0], text, markup, del_msg=False)
     return total
 
 
-def make_report(in_order: bool = True) -> dict:
+async def make_report(in_order: bool = True) -> List:
     """
-    Make report dict: dish-data
-    :return: Made report dict
+    Make report of the current shift from its running totals
+    :param in_order: Adds in order products for a report
+    :return: Made report rows: dish, paid count, total price, pre-ordered count
     """
-    payments: tuple = tuple(payment[0] for payment in sql_db.get_in_time_payments())
-    orders: dict = dict()
-    for order in sql_db.get_report(payments, in_order):
-        if order[0] in orders:
-            dish: dict = orders[order[0]]
-            dish["paid_count"] += order[1]
-            dish["total_price"] += order[1] * order[2]
-            dish["order_count"] += order[3]
-        else:
-            orders[order[0]] = {"paid_count": order[1], "total_price": order[1] * order[2], "order_count": order[3]}
+    orders: Dict[str, List] = {total[0]: [*total, 0] for total in sql_db.shift_totals.rows()}
+    if in_order:
+        for product, count in await sql_db.get_reserved():
+            orders.setdefault(product, [product, 0, 0.0, 0])[3] = count
+    return [tuple(orders[product]) for product in sorted(orders)]
+
+
+async def make_closing_report() -> List:
+    """
+    Recounts paid products of the shift and reconciles running totals with them
+    :return: Made report rows: dish, paid count, total price
+    """
+    orders: List = [order[:3] for order in await sql_db.get_report(in_order=False) if order[1]]
+    totals: List = sql_db.shift_totals.rows()
+    if [(*order[:2], round(order[2], 2)) for order in orders] != [(*total[:2], round(total[2], 2)) for total in totals]:
+        logging.warning(ru.WRN_SHIFT_TOTALS_MISMATCH.format(totals, orders))
     return orders
 
 
-async def get_payment_products(message, payment_id) -> bool:
+async def get_payment_products(payment_id) -> List[str]:
     """
     Make list of payment's product's and theirs count in order
-    :param message: Aiogram Message object
     :param payment_id: Payment id in database
-    :return: Shown list of payment's products
-    """
-    products: list = sql_db.get_paid_products(payment_id)
-    print(payment_id)
-    if not products:
-        return False
-    length: int = 0
-    responses: list = [[]]
-    for product in products:
-        product_msg: str = ru.MSG_ADMIN_PAID_PRODUCT.format(payment_id, product[0], product[1])
-        length += len(product_msg) + 1
-        if length > 500:
-            responses.append([])
-            length: int = len(product_msg) + 1
-        responses[-1].append(product_msg)
-    for response in responses:
-        await respond(message, "\n".join(response), del_msg=False)
-    return True
+    :return: Lines of payment's products, empty if there is no such payment
+    """
+    products: list = await sql_db.get_paid_products(payment_id)
+    return [ru.MSG_ADMIN_PAID_PRODUCT.format(payment_id, escape_markdown(name), count) for name, count in products]
 
 
 LEVEL = LevelControl()
+carousel = LruCache(CAROUSEL_SNAPSHOTS)  # Menu's snapshots of the shown carousels by chat and message ids
+cards = LruCache(RENDER_CACHE)  # Dish's captions without the count by name, description and price
 
 
 if __name__ == '__main__':
-    print(make_report())
+    print(run(make_report()))
@@ -5,10 +5,12 @@ from aiogram.dispatcher.filters import Text
 from aiogram.types import Message, CallbackQuery
 from datetime import datetime as dt
 
+from core.create import router
 from core.messanger import respond
 from database import sql_db
-from handlers.base import LEVEL, check_user_registration, FSMCart, FSMContext, show_menu, show_orders
-from handlers.payment import create_payment_url
+from handlers.base import LEVEL, check_user_registration, FSMCart, FSMContext, show_menu, show_orders, turn_menu_page
+from handlers.outbox import wake_outbox
+from handlers.payment import payment_available
 from handlers.client import kitchen, bar, hookah, start
 from keyboards.admin_kb import cancel_kb
 from keyboards.base_kb import make_inline_buttons, get_order_kb
@@ -42,7 +44,8 @@ async def show_kitchen_menu(message: Message) -> None:
     :param message: Aiogram message object
     :return: Kitchen menu
     """
-    await get_menu(message, sql_db.get_menu(ru.KITCHEN_CATEGORIES[message.text]), kitchen)
+    menu: list = await sql_db.get_menu(ru.KITCHEN_CATEGORIES[message.text], user_id=message.from_user.id)
+    await get_menu(message, menu, kitchen)
 
 
 async def show_bar_menu(message: Message) -> None:
@@ -51,7 +54,8 @@ async def show_bar_menu(message: Message) -> None:
     :param message: Aiogram message object
     :return: Bar menu
     """
-    await get_menu(message, sql_db.get_menu(ru.BAR_CATEGORIES[message.text]), bar)
+    menu: list = await sql_db.get_menu(ru.BAR_CATEGORIES[message.text], user_id=message.from_user.id)
+    await get_menu(message, menu, bar)
 
 
 async def show_hookah_menu(message: Message) -> None:
@@ -60,7 +64,8 @@ async def show_hookah_menu(message: Message) -> None:
     :param message: Aiogram message object
     :return: Hookah menu
     """
-    await get_menu(message, sql_db.get_menu(ru.HOOKAH_CATEGORIES[message.text]), hookah)
+    menu: list = await sql_db.get_menu(ru.HOOKAH_CATEGORIES[message.text], user_id=message.from_user.id)
+    await get_menu(message, menu, hookah)
 
 
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -69,19 +74,19 @@ async def show_hookah_menu(message: Message) -> None:
 # -------------------------------------------------------------------------------------------------------------------- #
 # User cart's functions                                                                                                #
 # -------------------------------------------------------------------------------------------------------------------- #
-async def add_to_cart(query: CallbackQuery, state: FSMContext = None) -> None:
+async def add_to_cart(query: CallbackQuery, product: str, state: FSMContext = None) -> None:
     """
     Adds dishes into client's shopping cart
     :param query: Aiogram message object
+    :param product: Product's name
     :param state: Aiogram FSMContext
     :return: Added new position into client's shopping cart
     """
     LEVEL.add(start)
-    product: str = query.data.replace("order_add ", "")
     await FSMCart.count.set()
     async with state.proxy() as data:
         data["product"] = product
-    count: int = sql_db.check_in_pre_order(product, query.from_user.id)
+    count: int = await sql_db.check_in_pre_order(product, query.from_user.id)
     if count > 0:
         await respond(query, ru.MSG_CART_EXISTS.format(product, count), cancel_kb, del_msg=False)
     else:
@@ -107,11 +112,11 @@ async def set_order_count(message: Message, state: FSMContext) -> None:
     async with state.proxy() as data:
         product: str = data["product"]
     await state.finish()
-    exists: int = sql_db.get_product_count(product) - sql_db.get_ordered(product, message.from_user.id)
+    exists: int = await sql_db.get_available(product, message.from_user.id)
     if count > exists:
         await respond(message, ru.ERR_NOT_ENOUGH.format(exists, product, exists), del_msg=False)
         count: int = exists
-    sql_db.add_product_into_cart(product, message.from_user.id, count)
+    await sql_db.add_product_into_cart(product, message.from_user.id, count)
     await respond(message, ru.MSG_ADDED.format(product, count), del_msg=False)
     await LEVEL.up(message)
 
@@ -123,7 +128,7 @@ async def show_user_order_cart(message: Message) -> None:
     :return: Shown user's order cart
     """
     LEVEL.add(start)
-    orders: list = sql_db.get_orders(message.from_user.id)
+    orders: list = await sql_db.get_orders(message.from_user.id)
     if orders:
         total_price: float = await show_orders(
             orders, message, (ru.NLN_CHANGE_ORDER, ru.NLN_DEL_ORDER), ("order_add {}", "order_del {}")
@@ -139,7 +144,7 @@ async def show_user_payments(message: Message) -> None:
     :param message: Aiogram message object
     :return: Shown user's paid orders
     """
-    orders: list = sql_db.get_user_payments(message.from_user.id)
+    orders: list = await sql_db.get_user_payments(message.from_user.id)
     if orders:
         for order in orders:
             readable_time: str = dt.fromtimestamp(order[2]).strftime("%D %H:%M")
@@ -154,14 +159,14 @@ async def show_user_payments(message: Message) -> None:
         await respond(message, ru.MSG_NO_PAYMENTS)
 
 
-async def ask_del_from_cart(query: CallbackQuery) -> None:
+async def ask_del_from_cart(query: CallbackQuery, name: str) -> None:
     """
     Asks confirmation to delete order from order's cart
     :param query: Aiogram CallbackQuery object
+    :param name: Product's name
     :return: Shown confirmation buttons
     """
     LEVEL.add(show_user_order_cart)
-    name: str = query.data.replace("order_del ", "")
     markup = make_inline_buttons(
         (ru.NLN_CONFIRM, ru.NLN_CANCEL),
         (f"conf_ord_del{name}", f"decl_ord_del{name}"),
@@ -169,15 +174,16 @@ async def ask_del_from_cart(query: CallbackQuery) -> None:
     await respond(query, ru.MSG_CONFIRM_DEL_ORDER.format(name), markup, del_msg=False)
 
 
-async def del_from_cart(query: CallbackQuery) -> None:
+async def del_from_cart(query: CallbackQuery, name: str, confirmed: bool) -> None:
     """
     Deletes or cancels deletion order from user's cart
     :param query: Aiogram CallbackQuery object
+    :param name: Product's name
+    :param confirmed: True if the user has confirmed deletion
     :return: Deleted order from user's cart
     """
-    name: str = query.data.replace("conf_ord_del", "")
-    if query.data.startswith("conf_ord_del"):
-        sql_db.update_in_cart_product_count(0, name, query.from_user.id)
+    if confirmed:
+        await sql_db.update_in_cart_product_count(0, name, query.from_user.id)
         await respond(query, ru.MSG_ADMIN_DELETED.format(name))
     else:
         await respond(query, ru.MSG_ADMIN_CANCELED)
@@ -195,15 +201,16 @@ async def ask_del_my_cart(message: Message) -> None:
     await respond(message, ru.MSG_CONFIRM_DEL_ORDERS, markup)
 
 
-async def del_my_cart(query: CallbackQuery) -> None:
+async def del_my_cart(query: CallbackQuery, confirmed: bool) -> None:
     """
     Deletes or cancels deletion all orders from user's cart
     :param query: Aiogram CallbackQuery object
+    :param confirmed: True if the user has confirmed deletion
     :return: Deleted order from user's cart
     """
-    if query.data == "confirm_orders_del":
+    if confirmed:
         LEVEL.add(start)
-        sql_db.cancel_user_orders(query.from_user.id)
+        await sql_db.cancel_user_orders(query.from_user.id)
         await respond(query, ru.MSG_ORDERS_DELETED)
     else:
         await respond(query, ru.MSG_ADMIN_CANCELED)
@@ -227,34 +234,31 @@ async def ask_pay_orders(message: Message) -> None:
     await respond(message, ru.MSG_CONFIRM_PAY_ORDERS, markup)
 
 
-async def ask_payment_url(query: CallbackQuery) -> None:
+async def ask_payment_url(query: CallbackQuery, confirmed: bool) -> None:
     """
-    Requests payment's url and sends it to user
+    Moves user's cart into payment and queues the request of payment's url, the link is sent by the outbox worker
     :param query: Aiogram CallbackQuery object
+    :param confirmed: True if the user has confirmed payment
     :return: Shown inline button with a link to pay
     """
-    if query.data == "confirm_orders_pay":
+    if confirmed:
         user_id: int = query.from_user.id
-        orders: list = sql_db.get_orders_to_pay(user_id)
-        if not orders:
-            await respond(query, ru.MSG_NO_ORDERS)
+        if not payment_available():
+            await respond(query, ru.ERR_PAYMENT_UNAVAILABLE)
             return
-        total_price: float = sum(order[1] * order[2] for order in orders)
-        payment_id: int = sql_db.create_payment(user_id, total_price)
-        logging.info(ru.INF_START_DECLARATION)
+        logging.info(ru.INF_START_DECLARATION.format(user_id))
         try:
-            for order in orders:
-                sql_db.make_payment_list(payment_id, *order)
-                sql_db.sum_product_count(-1 * order[2], order[0])
-            sql_db.cancel_user_orders(user_id)
+            payment_id, total_price = await sql_db.checkout(user_id)
         except Exception as exc:
             logging.error(exc)
             await respond(query, ru.MSG_PAY_CANCELED)
-        else:
-            logging.info(ru.MSG_ADMIN_PAYMENT_LIST_CREATED)
-            payment_url: str = await create_payment_url(total_price, payment_id)
-            markup = make_inline_buttons((ru.NLN_TO_PAY.format(total_price),), (payment_url,))
-            await respond(query, ru.MSG_PAYMENT_LINK, markup)
+            return
+        if not payment_id:
+            await respond(query, ru.MSG_NO_ORDERS)
+            return
+        logging.info(ru.MSG_ADMIN_PAYMENT_LIST_CREATED)
+        wake_outbox()
+        await respond(query, ru.MSG_PAYMENT_LINK_PENDING.format(payment_id, total_price))
     else:
         await respond(query, ru.MSG_PAY_CANCELED)
 
@@ -274,19 +278,17 @@ def reg_menu_handlers(dp: Dispatcher) -> None:
         dp.register_message_handler(show_bar_menu, Text(equals=command, ignore_case=True))
     for command in ru.HOOKAH_CATEGORIES.keys():
         dp.register_message_handler(show_hookah_menu, Text(equals=command, ignore_case=True))
-    dp.register_callback_query_handler(add_to_cart, lambda q: q.data and q.data.startswith("order_add "), state=None)
+    router.add("order_add ", add_to_cart, str)
+    router.add("menu_page ", turn_menu_page, int, state="*")
     dp.register_message_handler(set_order_count, state=FSMCart.count)
     dp.register_message_handler(show_user_order_cart, Text(equals=ru.CMD_MY_CART))
-    dp.register_callback_query_handler(ask_del_from_cart, lambda q: q.data and q.data.startswith("order_del "))
-    dp.register_callback_query_handler(
-        del_from_cart, lambda q: q.data and (q.data.startswith("conf_ord_del") or q.data.startswith("decl_ord_del"))
-    )
+    router.add("order_del ", ask_del_from_cart, str)
+    router.add("conf_ord_del", del_from_cart, str, confirmed=True)
+    router.add("decl_ord_del", del_from_cart, str, confirmed=False)
     dp.register_message_handler(ask_del_my_cart, Text(equals=ru.CMD_DEL_ORDERS))
-    dp.register_callback_query_handler(
-        del_my_cart, lambda q: q.data and (q.data == "confirm_orders_del" or q.data == "cancel_orders_del")
-    )
+    router.add("confirm_orders_del", del_my_cart, confirmed=True)
+    router.add("cancel_orders_del", del_my_cart, confirmed=False)
     dp.register_message_handler(ask_pay_orders, Text(startswith=ru.CMD_ORDER[0]))
-    dp.register_callback_query_handler(
-        ask_payment_url, lambda q: q.data and (q.data == "confirm_orders_pay" or q.data == "cancel_orders_pay")
-    )
+    router.add("confirm_orders_pay", ask_payment_url, confirmed=True)
+    router.add("cancel_orders_pay", ask_payment_url, confirmed=False)
     dp.register_message_handler(show_user_payments, Text(equals=ru.CMD_SHOW_MY_PAYMENTS))
@@ -0,0 +1,142 @@
+import logging
+
+from asyncio import Event, gather, Semaphore, sleep, TimeoutError as WaitTimeout, wait_for
+from time import time
+from typing import Dict, Tuple
+
+from core import config as cfg
+from core.messanger import notify
+from database import sql_db
+from handlers.payment import apply_statuses, create_payment_url, get_response, make_token
+from keyboards.base_kb import make_url_button
+from localization import ru
+
+outbox_wakeup: Event = Event()
+# https://www.tinkoff.ru/kassa/develop/api/payments/getstate-response/ - the payer hasn't paid yet
+UNPAID_STATUSES = "NEW", "FORM_SHOWED"
+
+
+def wake_outbox() -> None:
+    """
+    Wakes the outbox worker up after a new operation has been queued
+    :return: None
+    """
+    outbox_wakeup.set()
+
+
+async def init_payment(payment_id: int) -> bool:
+    """
+    Asks the bank for the payment link and sends it to the payer. The link is kept with the payment till it is sent, so
+    the repeated operation sends the same link again instead of asking the bank. The order with a link is never
+    changed, the next checkout makes a new one
+    :param payment_id: Payment's id in database, it is the bank's OrderId
+    :return: True if the operation is done and needn't be repeated
+    """
+    payment: Tuple = await sql_db.get_payment(payment_id)
+    if not payment or payment[3] != "NEW":
+        return True
+    user_id, bank_payment_id, amount = payment[:3]
+    if bank_payment_id:
+        payment_url, sent = await sql_db.get_payment_link(payment_id)
+        if sent or not payment_url:
+            return True
+    else:
+        payment_url = await create_payment_url(amount, payment_id, user_id)
+        if not payment_url:
+            return False
+    markup = make_url_button(ru.NLN_TO_PAY.format(amount), payment_url)
+    if await notify(user_id, ru.MSG_PAYMENT_LINK, markup):
+        await sql_db.mark_link_sent(payment_id)
+    return True
+
+
+async def cancel_payment(bank_payment_id: int) -> bool:
+    """
+    Cancels the bank's payment, whose link hasn't been sent, if it is still unpaid. The paid one is never cancelled,
+    since cancel of a paid payment is a refund
+    :param bank_payment_id: Bank's payment id
+    :return: True if the operation is done and needn't be repeated
+    """
+    data: dict = {"PaymentId": bank_payment_id, "TerminalKey": cfg.TERMINAL_KEY, "Token": make_token(bank_payment_id)}
+    response = await get_response("post", cfg.STATE_PAYMENT_API, json_data=data)
+    if not response:
+        return False
+    status: str = response.json().get("Status", "")
+    if status not in UNPAID_STATUSES:
+        logging.warning(ru.WRN_OUTBOX_NOT_CANCELED.format(bank_payment_id, status))
+        return True
+    return bool(await get_response("post", cfg.CANCEL_PAYMENT_API, json_data=data))
+
+
+async def abandon_operation(operation: str, payment_id: int) -> None:
+    """
+    Gives the operation up after the last attempt: the order, whose link hasn't been got, is cancelled, so its products
+    return to stock, and the payer is informed
+    :param operation: "init" or "cancel"
+    :param payment_id: Payment's id in database or bank's payment id for "cancel"
+    :return: None
+    """
+    logging.error(ru.ERR_OUTBOX_ABANDONED.format(operation, payment_id))
+    payment: Tuple = await sql_db.get_payment(payment_id) if operation == "init" else ()
+    if payment and await apply_statuses([("CANCELED", payment_id)]):
+        try:
+            await notify(payment[0], ru.ERR_PAYMENT_CANCELED.format(payment_id))
+        except Exception as exc:
+            logging.error(ru.ERR_NOT_NOTIFIED.format(payment[0], exc))
+
+
+OPERATIONS: Dict = {"init": init_payment, "cancel": cancel_payment}
+
+
+async def do_operation(operation: Tuple, semaphore: Semaphore) -> bool:
+    """
+    Does the outbox operation: removes it if it succeeds, otherwise postpones it with exponential backoff or gives it
+    up after OUTBOX_RETRIES attempts. The operation is removed only after it is done, so it is done at least once
+    :param operation: Id, operation, payment id, attempts and due time of the operation
+    :param semaphore: Limit of simultaneous operations
+    :return: False if the operation's result hasn't been saved, so it stays due
+    """
+    operation_id, name, payment_id, attempts, due = operation
+    async with semaphore:
+        try:
+            done: bool = await OPERATIONS[name](payment_id)
+        except Exception as exc:
+            logging.error(exc)
+            done = False
+    try:
+        if not done and attempts + 1 < cfg.OUTBOX_RETRIES:
+            delay: float = min(cfg.OUTBOX_BACKOFF[0] * 2**attempts, cfg.OUTBOX_BACKOFF[1])
+            await sql_db.postpone_operation(operation_id, due, time() + delay)
+            return True
+        if not done:
+            await abandon_operation(name, payment_id)
+        await sql_db.finish_operation(operation_id, due)
+    except Exception:
+        logging.exception(ru.ERR_OUTBOX_NOT_SAVED.format(name, payment_id))
+        return False
+    return True
+
+
+async def process_outbox():
+    """
+    Processes the outbox: does due operations concurrently and sleeps till the next one or till a new operation. After
+    an error the worker sleeps for the first backoff and goes on, so it never stops
+    :return: Done operations
+    """
+    semaphore: Semaphore = Semaphore(cfg.OUTBOX_WORKERS)
+    while True:
+        outbox_wakeup.clear()
+        try:
+            operations, following = await sql_db.get_due_operations(time(), cfg.OUTBOX_WORKERS * 2)
+            if operations:
+                if not all(await gather(*(do_operation(operation, semaphore) for operation in operations))):
+                    await sleep(cfg.OUTBOX_BACKOFF[0])
+                continue
+        except Exception:
+            logging.exception(ru.ERR_OUTBOX_SWEEP.format(cfg.OUTBOX_BACKOFF[0]))
+            await sleep(cfg.OUTBOX_BACKOFF[0])
+            continue
+        try:
+            await wait_for(outbox_wakeup.wait(), following - time() if following else None)
+        except WaitTimeout:
+            pass
@@ -1,78 +1,349 @@
 import httpx
 import logging
 
-from asyncio import sleep, run
+from aiohttp import web
+from asyncio import Event, gather, sleep, Semaphore, TimeoutError as WaitTimeout, wait_for
 from hashlib import sha256
-from requests import post, Response, get
-from typing import Union
+from hmac import compare_digest
+from heapq import heappop, heappush
+from httpx import Response
+from time import time
+from typing import Dict, List, Tuple, Union
+from urllib.parse import urlparse
 
 from core import config as cfg
-from core.create import bot
+from core.create import breakers, http, retry_budget
+from core.messanger import notify
+from core.resilience import CircuitBreaker, get_backoff
 from database import sql_db
 from localization import ru
 
+# Last polling sweep: payments asked, statuses changed, duration and delay of the start against the schedule (sec),
+# and the counters of the shift: sweeps, the longest sweep and the greatest delay (sec)
+sweep_stats: Dict[str, float] = {
+    "payments": 0,
+    "changed": 0,
+    "duration": 0.0,
+    "lag": 0.0,
+    "sweeps": 0,
+    "max_duration": 0.0,
+    "max_lag": 0.0,
+}
+# Poll schedule: heap of (due time, payment id) and due time, bank's payment id, user id, creation time by payment id
+poll_queue: List[Tuple[float, int]] = []
+scheduled_payments: Dict[int, Tuple[float, Union[int, str], int, float]] = dict()
+poll_wakeup: Event = Event()
 
-async def create_payment_url(price: float, payment_id: int) -> str:
+
+async def create_payment_url(price: float, payment_id: int, user_id: int) -> str:
     payment_data: dict = {"TerminalKey": cfg.TERMINAL_KEY, "Amount": price * 100, "OrderId": payment_id}
+    if cfg.NOTIFICATION_URL:
+        payment_data["NotificationURL"] = cfg.NOTIFICATION_URL
     payment_response: Response = await get_response("post", cfg.INIT_PAYMENT_API, json_data=payment_data)
-    if payment_response:
-        payment_response: dict = payment_response.json()
-        url: Response = await get_response("get", "https://clck.ru/--?url=" + payment_response["PaymentURL"])
-        if url:
-            url: str = url.text
-            sql_db.update_payment_id(payment_response["PaymentId"], payment_id)
-            return url
+    payment_response: dict = payment_response.json() if payment_response else {}
+    if payment_response.get("PaymentURL"):
+        url: str = payment_response["PaymentURL"]
+        if cfg.SHORT_LINKS_URL:
+            url = cfg.SHORT_LINKS_URL.rstrip("/") + "/" + await sql_db.add_short_link(url)
+        if not await sql_db.update_payment_id(payment_response["PaymentId"], payment_id, price, url):
+            # The order has been changed during the request, its initialization is queued once more
+            logging.warning(ru.WRN_PAYMENT_CHANGED.format(payment_id, payment_response["PaymentId"]))
+            if cfg.CANCEL_PAYMENT_API:
+                bank_payment_id: Union[int, str] = payment_response["PaymentId"]
+                await sql_db.add_operation("cancel", bank_payment_id, f"cancel:{bank_payment_id}")
+            return ""
+        schedule_payment(payment_id, payment_response["PaymentId"], user_id, time())
+        return url
     return ""
 
 
+def get_poll_delay(age: float) -> float:
+    """
+    Finds the break before the next poll: fresh payments are polled after STATE_PAYMENT_INTERVALS (or after
+    STATE_PAYMENT_FALLBACK, if the bank sends notifications), then the break
+    doubles up to STATE_PAYMENT_RETRIES, the last poll falls on the payment's expiry
+    :param age: Seconds since the payment was created
+    :return: Seconds till the next poll
+    """
+    offset: float = 0
+    interval: float = 0
+    for interval in cfg.STATE_PAYMENT_FALLBACK if cfg.NOTIFICATION_URL else cfg.STATE_PAYMENT_INTERVALS:
+        offset += interval
+        if offset > age:
+            return offset - age
+    while offset <= age and offset < cfg.STATE_PAYMENT_LIFETIME:
+        interval = min(interval * 2, cfg.STATE_PAYMENT_RETRIES)
+        offset += interval
+    return max(min(offset, cfg.STATE_PAYMENT_LIFETIME) - age, 0)
+
+
+def schedule_payment(payment_id: int, bank_payment_id: Union[int, str], user_id: int, created: float) -> None:
+    """
+    Puts the payment into the poll queue or moves it there, if it has been already scheduled
+    :param payment_id: In database payment id
+    :param bank_payment_id: Bank's payment id
+    :param user_id: Payer tg id
+    :param created: Time of the payment creation (timestamp)
+    :return: None
+    """
+    now: float = time()
+    due: float = now + get_poll_delay(now - created)
+    scheduled_payments[payment_id] = (due, bank_payment_id, user_id, created)
+    heappush(poll_queue, (due, payment_id))
+    poll_wakeup.set()
+
+
+def pop_due_payments(now: float) -> List[Tuple]:
+    """
+    Takes the payments, whose time to poll has come, out of the poll queue
+    :param now: Current time (timestamp)
+    :return: In database id, bank's payment id, user id, creation and due time of the payments
+    """
+    result: List[Tuple] = []
+    while poll_queue and poll_queue[0][0] <= now:
+        due, payment_id = heappop(poll_queue)
+        payment: Tuple = scheduled_payments.get(payment_id, ())
+        if payment and payment[0] == due:
+            del scheduled_payments[payment_id]
+            result.append((payment_id, *payment[1:], due))
+    return result
+
+
+def make_token(payment_id: Union[int, str]) -> str:
+    """
+    Signs requests to the bank and checks the bank's notifications
+    :param payment_id: Bank's payment id
+    :return: SHA-256 token
+    """
+    # https://www.tinkoff.ru/kassa/develop/api/request-sign/
+    return sha256(f"{cfg.TERMINAL_PASSWORD}{payment_id}{cfg.TERMINAL_PASSWORD}".encode("utf-8")).hexdigest()
+
+
+async def get_payment_state(payment: Tuple, semaphore: Semaphore) -> str:
+    """
+    Asks the bank for the state of the payment, not more than the semaphore allows at the same time
+    :param payment: In database id, bank's payment id and user id
+    :param semaphore: Limit of simultaneous requests to the bank
+    :return: Payment status or empty string
+    """
+    data: dict = {"PaymentId": payment[1], "TerminalKey": cfg.TERMINAL_KEY, "Token": make_token(payment[1])}
+    async with semaphore:
+        response: Response = await get_response(
+            "post", cfg.STATE_PAYMENT_API, json_data=data, retries=1, timeout=cfg.STATE_PAYMENT_TIMEOUT
+        )
+    if not response:
+        return ""
+    try:
+        return str(response.json().get("Status", ""))
+    except (ValueError, AttributeError):
+        logging.warning(ru.WRN_BAD_BANK_RESPONSE.format(response.url, response.text[:200]))
+        return ""
+
+
+async def return_to_stock(payments: List[int]) -> int:
+    """
+    Returns products of unpaid payments to stock
+    :param payments: In database payment ids
+    :return: Count of the returned items
+    """
+    if not payments:
+        return 0
+    items: int = await sql_db.restock_payments(payments)
+    logging.info(ru.INF_RESTOCKED.format(len(payments), items))
+    return items
+
+
+async def apply_statuses(statuses: List[Tuple[str, int]]) -> int:
+    """
+    Updates payment statuses in database, stops polling of changed payments, returns products of unpaid ones to stock
+    and only then informs payers, a failed notification doesn't stop the others. Repeated and late statuses change
+    nothing, so polls and notifications about the same payment may come in any order. In-between statuses aren't
+    saved, the payment is polled till the final one
+    :param statuses: Pairs of new status from bank and in database payment id
+    :return: Number of changed payments
+    """
+    statuses = [(status, payment_id) for status, payment_id in statuses if status in sql_db.FINAL_STATUSES]
+    changed: List[Tuple[str, int, int]] = await sql_db.change_payment_statuses(statuses) if statuses else []
+    for _, payment_id, _ in changed:
+        scheduled_payments.pop(payment_id, None)
+    await return_to_stock([payment_id for status, payment_id, _ in changed if status in sql_db.NOT_PAID_STATUSES])
+    for status, payment_id, user_id in changed:
+        if status == "CONFIRMED":
+            text: str = ru.MSG_PAYMENT_CONFIRMED.format(payment_id)
+        elif status in sql_db.NOT_PAID_STATUSES and status != "CANCELED":
+            text = ru.ERR_NOT_PAID.format(payment_id)
+        else:
+            continue
+        try:
+            await notify(user_id, text)
+        except Exception as exc:
+            logging.error(ru.ERR_NOT_NOTIFIED.format(user_id, exc))
+    return len(changed)
+
+
+async def poll_payments(payments: List[Tuple], semaphore: Semaphore) -> None:
+    """
+    Polls the due payments, updates changed statuses in database, informs payers and schedules the next polls. The
+    last poll falls on the payment's expiry: the payment is expired only if the bank hasn't answered a final status
+    :param payments: In database id, bank's payment id, user id, creation and due time of the payments
+    :param semaphore: Limit of simultaneous requests to the bank
+    :return: None
+    """
+    started: float = time()
+    lag: float = started - min(payment[4] for payment in payments)
+    statuses: list = await gather(*(get_payment_state(payment, semaphore) for payment in payments))
+    expired: List[int] = []
+    for status, payment in zip(statuses, payments):
+        if status in sql_db.FINAL_STATUSES:
+            continue
+        if started - payment[3] >= cfg.STATE_PAYMENT_LIFETIME:
+            expired.append(payment[0])
+        else:
+            schedule_payment(*payment[:4])
+    changed: int = await apply_statuses([(status, payment[0]) for status, payment in zip(statuses, payments)])
+    if expired:
+        await return_to_stock(await sql_db.expire_old_payments(expired))
+    duration: float = time() - started
+    sweep_stats.update(payments=len(payments), changed=changed, duration=duration, lag=lag)
+    sweep_stats.update(
+        sweeps=sweep_stats["sweeps"] + 1,
+        max_duration=max(sweep_stats["max_duration"], duration),
+        max_lag=max(sweep_stats["max_lag"], lag),
+    )
+    logging.info(ru.INF_PAYMENT_SWEEP.format(**sweep_stats))
+
+
+async def receive_notification(request: web.Request) -> web.Response:
+    """
+    Receives the bank's notification about the payment status and applies it at once
+    https://www.tinkoff.ru/kassa/develop/api/notifications/
+    :param request: Bank's notification
+    :return: "OK", so the bank stops repeating the notification
+    """
+    try:
+        data: dict = await request.json()
+    except ValueError:
+        return web.Response(status=httpx.codes.BAD_REQUEST)
+    if data.get("TerminalKey") != cfg.TERMINAL_KEY or not compare_digest(
+        str(data.get("Token", "")), make_token(data.get("PaymentId", ""))
+    ):
+        logging.warning(ru.WRN_BAD_NOTIFICATION.format(request.remote))
+        return web.Response(status=httpx.codes.FORBIDDEN)
+    status: str = data.get("Status", "")
+    payment_id: int = await sql_db.find_payment(data.get("PaymentId", ""))
+    if payment_id:
+        await apply_statuses([(status, payment_id)])
+    return web.Response(text="OK")
+
+
 async def check_payment_status():
     """
-    Check payment status and updates it in database
+    Check payment status and updates it in database: every new payment is polled on its own schedule. A failed sweep
+    is logged and its payments are scheduled again, so the poller never stops
     :return: Updated statuses of payments
     """
+    semaphore: Semaphore = Semaphore(cfg.STATE_PAYMENT_WORKERS)
+    loaded: bool = False
     while True:
-        not_paid: list = sql_db.expire_old_payments()
-        payments: list = sql_db.get_new_payments()
-        for payment in payments:
-            data: dict = {"PaymentId": payment[1], "TerminalKey": cfg.TERMINAL_KEY}
-            # https://www.tinkoff.ru/kassa/develop/api/request-sign/
-            token = sha256(f"{cfg.TERMINAL_PASSWORD}{payment[1]}{cfg.TERMINAL_PASSWORD}".encode("utf-8")).hexdigest()
-            data["Token"] = token
-            response: Response = await get_response("post", cfg.STATE_PAYMENT_API, json_data=data)
-            status: str = response.json().get("Status", "")
-            if status and status != "NEW":
-                sql_db.change_payment_status(status, payment[0])
-                if status == "CONFIRMED":
-                    await bot.send_message(payment[2], ru.MSG_PAYMENT_CONFIRMED.format(payment[0]))
-                elif status == "REJECTED":
-                    await bot.send_message(payment[2], ru.ERR_NOT_PAID.format(payment[0]))
-                    not_paid.append(payment[0])
-        for payment in not_paid:
-            adds: list = sql_db.get_paid_products(payment)
-            for add in adds:
-                sql_db.sum_product_count(add[1], add[0])
-        await sleep(cfg.STATE_PAYMENT_RETRIES)
-
-
-async def get_response(method: str, url: str, json_data: dict = None, params: dict = None) -> Union[Response, None]:
-    """
-    Tries to connect to any server or return empty string
+        poll_wakeup.clear()
+        payments: List[Tuple] = []
+        try:
+            if not loaded:
+                for payment in await sql_db.get_new_payments():
+                    schedule_payment(*payment)
+                loaded = True
+            payments = pop_due_payments(time())
+            if payments:
+                await poll_payments(payments, semaphore)
+                continue
+        except Exception:
+            logging.exception(ru.ERR_PAYMENT_SWEEP.format(cfg.STATE_PAYMENT_INTERVALS[0]))
+            for payment in payments:
+                schedule_payment(*payment[:4])
+            await sleep(cfg.STATE_PAYMENT_INTERVALS[0])
+            continue
+        try:
+            await wait_for(poll_wakeup.wait(), poll_queue[0][0] - time() if poll_queue else None)
+        except WaitTimeout:
+            pass
+
+
+def payment_available() -> bool:
+    """
+    Checks if the bank may be asked for a payment link now
+    :return: False while the bank's circuit breaker is open
+    """
+    return breakers.get(cfg.INIT_PAYMENT_API).available
+
+
+async def get_response(
+    method: str,
+    url: str,
+    json_data: dict = None,
+    params: dict = None,
+    retries: int = cfg.HTTP_RETRIES,
+    timeout: Union[float, None] = None,
+) -> Union[Response, None]:
+    """
+    Tries to connect to any server or return empty string. Fails fast while the host's circuit breaker is open,
+    retries after jittered breaks while the shared retry budget allows
     :param method: Method for connection
     :param url: Any url to connect
     :param json_data: Any additional post-request data
     :param params: Any additional get-request params
+    :param retries: Number of attempts
+    :param timeout: Overall request timeout (sec) instead of the client's default ones
     :return: Response
     """
-    for _ in range(cfg.INIT_PAYMENT_RETRIES[0]):
+    timeout: Union[float, httpx.Timeout] = timeout or http.timeout
+    breaker: CircuitBreaker = breakers.get(url)
+    retry_budget.deposit()
+    for attempt in range(retries):
+        if not breaker.allow():
+            return None
         try:
             if method.lower() == "post":
-                response: Response = post(url, json=json_data)
+                response: Response = await http.post(url, json=json_data, timeout=timeout)
             else:
-                response: Response = get(url, params=params)
-        except Exception as exc:
+                response: Response = await http.get(url, params=params, timeout=timeout)
+        except httpx.HTTPError as exc:
             logging.error(exc)
         else:
-            if response.status_code is httpx.codes.OK.value:
+            if response.status_code == httpx.codes.OK:
+                breaker.success()
                 return response
             logging.warning(f"{url} ({json_data or params or '-'}): {response.status_code}")
-        await sleep(cfg.INIT_PAYMENT_RETRIES[1])
+            if response.status_code < 500 and response.status_code != httpx.codes.TOO_MANY_REQUESTS:
+                breaker.success()
+                return None
+        breaker.failure()
+        if attempt + 1 == retries:
+            return None
+        if not retry_budget.withdraw():
+            logging.warning(ru.WRN_RETRY_BUDGET.format(url))
+            return None
+        await sleep(get_backoff(attempt, *cfg.HTTP_BACKOFF))
+
+
+async def open_short_link(request: web.Request) -> web.Response:
+    """
+    Redirects the payer from the short link to the payment page
+    :param request: Request of the short link
+    :return: Redirect or "Not found"
+    """
+    url: str = await sql_db.get_short_link(request.match_info["code"])
+    if not url:
+        raise web.HTTPNotFound()
+    raise web.HTTPFound(url)
+
+
+def reg_payment_routes(app: web.Application) -> None:
+    """
+    Register payment routes in the web application of the bot
+    :param app: Web application of the bot
+    :return: Registered payment routes
+    """
+    if cfg.NOTIFICATION_URL:
+        app.router.add_post(urlparse(cfg.NOTIFICATION_URL).path or "/", receive_notification)
+    if cfg.SHORT_LINKS_URL:
+        app.router.add_get(urlparse(cfg.SHORT_LINKS_URL).path.rstrip("/") + "/{code}", open_short_link)
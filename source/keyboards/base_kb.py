@@ -1,8 +1,12 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from typing import Tuple, Union
 
+from core.config import RENDER_CACHE
+from database.cache import LruCache
 from localization import ru
 
+markups = LruCache(RENDER_CACHE)  # Serialized inline keyboards by their buttons, callbacks and row width
+
 
 def append_kitchen_kb(keyboard: ReplyKeyboardMarkup) -> ReplyKeyboardMarkup:
     """
@@ -56,19 +60,64 @@ def append_categories_kb(keyboard: ReplyKeyboardMarkup) -> ReplyKeyboardMarkup:
     return keyboard
 
 
-def make_inline_buttons(buttons: tuple, callbacks: tuple) -> InlineKeyboardMarkup:
+def make_inline_buttons(buttons: tuple, callbacks: tuple, row_width: int = 1) -> InlineKeyboardMarkup:
     """
     Create inline buttons
     :param buttons: Callbacks to confirm operation
     :param callbacks: Callbacks to decline operation
+    :param row_width: Buttons in a row
+    :return: Created inline buttons
+    """
+    markup = InlineKeyboardMarkup(row_width=row_width)
+    markup.add(*(InlineKeyboardButton(buttons[index], callback_data=callbacks[index]) for index in range(len(buttons))))
+    return markup
+
+
+def get_inline_buttons(buttons: tuple, callbacks: tuple, row_width: int = 1) -> str:
+    """
+    Finds inline buttons serialized for the Bot API, they are created only once, e.g. the dish's button of the menu
+    :param buttons: Texts of the buttons
+    :param callbacks: Callbacks of the buttons
+    :param row_width: Buttons in a row
+    :return: Inline keyboard as JSON, it is sent as is
+    """
+    key: tuple = buttons, callbacks, row_width
+    markup: str = markups.get(key)
+    if markup is None:
+        markup = make_inline_buttons(buttons, callbacks, row_width).as_json()
+        markups.put(key, markup)
+    return markup
+
+
+def make_carousel_buttons(index: int, total: int, button: str, callback: str) -> InlineKeyboardMarkup:
+    """
+    Create inline buttons of the menu's page: previous and next pages and the dish's button
+    :param index: Index of the shown dish
+    :param total: Count of dishes in the menu
+    :param button: Dish's button
+    :param callback: Dish's callback
     :return: Created inline buttons
     """
     markup = InlineKeyboardMarkup()
-    for index in range(len(buttons)):
-        markup.add(InlineKeyboardButton(buttons[index], callback_data=callbacks[index]))
+    markup.row(
+        InlineKeyboardButton(ru.NLN_PREVIOUS, callback_data=f"menu_page {(index - 1) % total}"),
+        InlineKeyboardButton(ru.NLN_PAGE.format(index + 1, total), callback_data=f"menu_page {index}"),
+        InlineKeyboardButton(ru.NLN_NEXT, callback_data=f"menu_page {(index + 1) % total}"),
+    )
+    markup.add(InlineKeyboardButton(button, callback_data=callback))
     return markup
 
 
+def make_url_button(button: str, url: str) -> InlineKeyboardMarkup:
+    """
+    Create inline button opening the url
+    :param button: Text of the button
+    :param url: Url to open
+    :return: Created inline button
+    """
+    return InlineKeyboardMarkup().add(InlineKeyboardButton(button, url=url))
+
+
 def get_order_kb(price: float) -> ReplyKeyboardMarkup:
     """
     Creates in orders navigation keyboard with total price shown
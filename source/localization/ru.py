@@ -23,6 +23,7 @@ MSG_PRICE = "*Сумма*: {}"
 MSG_MENU_EMPTY = "В этом меню пока ничего нет, но мы уже работаем над его наполнением."
 MSG_NO_ORDERS = "Заказов пока нет, но это легко исправить. В нашем меню богатый выбор."
 MSG_NO_PAYMENTS = "Оплаченных заказов пока нет, но это легко исправить. В нашем меню богатый выбор."
+MSG_MENU_BUTTONS = "Выберите позицию:"
 MSG_SHOWN_MENU = (
     '*Примечание:* Чтобы что-то выбрать, необходимо нажать на кнопку "Заказать" под ним, а затем указать количество.'
     "\n\n*Важно*: Если этот пункт уже есть в заказе, будет сохранено то количество, которое указано последним."
@@ -39,6 +40,7 @@ MSG_CONFIRM_DEL_ORDER = "Удалить из заказа {}?"
 MSG_CONFIRM_DEL_ORDERS = "Очистить весь список заказов?"
 MSG_CONFIRM_PAY_ORDERS = "Пора заказывать? Будет вкусно и быстро 😉"
 MSG_HAS_BEEN_PAID = "Платеж на *сумму* {} ₽ подтвержден. *№ заказа*: {}, скоро он будет готов. Приятного аппетита! 🍽️"
+MSG_PAYMENT_LINK_PENDING = "Заказ принят, *платеж №* {} на {} ₽. Ссылку на оплату пришлю через несколько секунд."
 MSG_PAY_CANCELED = "Ссылка не была создана. Вы можете попробовать снова или обратиться к администратору."
 MSG_ORDER_NUM_INF = "Вы всегда можете обратиться к администратору с номером заказа для уточнения информации."
 MSG_ADMIN_PAYMENT_LIST_CREATED = "Список продуктов из заказа создан."
@@ -126,6 +128,9 @@ NLN_CONFIRM = "Подтвердить"
 NLN_CANCEL = "Отменить"
 NLN_CHANGE = "Изменить {}"
 NLN_ADD_TO_CART = "Заказать {}"
+NLN_PREVIOUS = "◀"
+NLN_NEXT = "▶"
+NLN_PAGE = "{} / {}"
 NLN_DEL_ORDER = "Удалить из заказа {}"
 NLN_CHANGE_ORDER = "Изменить количество {}"
 NLN_TO_PAY = "Оплатить {} ₽"
@@ -150,6 +155,16 @@ ERR_ADMIN_CANT_ADD = "Не удалось внести изменения в б
 ERR_NOT_ENOUGH = "В наличии есть только {} {}. В заказ будет *добавлено {}*."
 ERR_NAME_TOO_LONG = "Название слишком длинное, попробуй уместиться в 25 символов."
 ERR_NOT_PAID = "*Платеж №* {} не прошел. Пожалуйста, обратитесь в ваш банк по этому вопросу."
+ERR_PAYMENT_UNAVAILABLE = "Банк сейчас не отвечает, оплата временно недоступна. Пожалуйста, попробуйте через минуту."
+ERR_MENU_OUTDATED = "Меню устарело, откройте категорию снова."
+ERR_PAYMENT_CANCELED = "Не удалось получить ссылку на оплату, *платеж №* {} отменен. Пожалуйста, оформите заказ снова."
+ERR_OUTBOX_ABANDONED = "Операция {} для платежа {} не удалась после всех попыток."
+ERR_OUTBOX_NOT_SAVED = "Результат операции {} для платежа {} не сохранен, она будет повторена."
+ERR_OUTBOX_SWEEP = "Обработка очереди операций прервана ошибкой, повтор через {} сек."
+WRN_PAYMENT_CHANGED = "Заказ {} изменился во время запроса ссылки, платеж банка {} не будет отправлен."
+WRN_OUTBOX_NOT_CANCELED = "Платеж {} не отменен в банке: его статус {}."
+ERR_NOT_NOTIFIED = "Не удалось отправить уведомление пользователю {}: {}"
+ERR_DB_MIGRATION = "Не удалось обновить базу данных до версии {}."
 # -------------------------------------------------------------------------------------------------------------------- #
 
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -187,4 +202,28 @@ INF_POSITION_START_UPD = "Начинаю обновлять {}"
 INF_POSITION_START_ADD = "Начинаю добавлять {}"
 INF_START_DECLARATION = "Началась обработка заказа пользователя {}."
 INF_DECLARATION_FINISHED = "Заказ пользователя {} успешно обработан."
+INF_DB_MIGRATED = "База данных обновлена до версии {}."
+WRN_LATE_CONFIRMATION = "Платеж {} подтвержден банком после статуса {}, его товары снова списаны со склада."
+WRN_SHIFT_TOTALS_MISMATCH = "Итоги смены {} не совпали с пересчетом {}, в отчет попадет пересчет."
+INF_SHIFT_ARCHIVED = "Смена закрыта, в архив перенесено платежей: {}."
+INF_PAYMENT_SWEEP = "Опрос платежей: {payments}, изменилось {changed}, за {duration:.2f} сек, опоздание {lag:.2f} сек."
+INF_PAYMENT_SWEEP_STATS = (
+    "Опросов платежей за смену: {sweeps}, самый долгий {max_duration:.2f} сек, наибольшее опоздание {max_lag:.2f} сек."
+)
+ERR_PAYMENT_SWEEP = "Опрос платежей прерван ошибкой, повтор через {} сек."
+WRN_BAD_BANK_RESPONSE = "Банк ({}) прислал ответ не в JSON: {}"
+INF_WEB_STARTED = "Бот принимает HTTP-запросы на {}:{}."
+WRN_BAD_NOTIFICATION = "Отклонено уведомление с неверной подписью от {}."
+WRN_CIRCUIT_OPENED = "{} не отвечает, запросы к нему приостановлены на {} сек."
+INF_CIRCUIT_CLOSED = "{} снова отвечает."
+WRN_RETRY_BUDGET = "Запас повторных запросов исчерпан, {} не будет запрошен повторно."
+INF_RESTOCKED = "По неоплаченным платежам ({}) на склад возвращено позиций: {}."
+INF_SENDER_STATS = (
+    "Очередь сообщений: ждут {depth}, поставлено {queued}, отправлено {sent}, ошибок {failed}, "
+    "повторов после RetryAfter {retries}, наибольшее ожидание {max_wait:.1f} сек., "
+    "удалено сообщений {deleted} за {delete_requests} запросов."
+)
+INF_ROUTE_STATS = "Кнопки {}: нажатий {hits}, ошибок {errors}, в среднем {average:.3f} сек., наибольшее {max:.3f} сек."
+WRN_BAD_CALLBACK = "Неверные данные кнопки {} от пользователя {}."
+INF_MENU_CACHE_STATS = "Кэш меню: категорий {categories}, попаданий {hits}, промахов {misses}."
 # -------------------------------------------------------------------------------------------------------------------- #
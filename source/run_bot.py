@@ -1,34 +1,56 @@
 from aiogram.utils import executor
+from aiohttp import web
 from asyncio import get_event_loop
 
+from core import config as cfg
 from core.config import logging
-from core.create import dp
+from core.create import dp, http, router, web_app
 from database import sql_db
 from handlers.admin_menu import reg_admin_menu_handlers
 from handlers.admin_shift import reg_admin_shift_handlers
+from handlers.base import save_new_users
 from handlers.client import reg_division_handlers
 from handlers.menu import reg_menu_handlers
-from handlers.payment import check_payment_status
+from handlers.outbox import process_outbox
+from handlers.payment import check_payment_status, reg_payment_routes
 from localization import ru
 
+web_runner = web.AppRunner(web_app)
+
 
 async def on_startup(_):
     logging.info(ru.INF_BOT_CONNECTED)
-    sql_db.sql_start()
+    await sql_db.sql_start()
+    await sql_db.load_shift_totals()
+    loop = get_event_loop()  # background tasks need the database started
+    loop.create_task(check_payment_status())
+    loop.create_task(process_outbox())
+    loop.create_task(save_new_users())
+    if cfg.NOTIFICATION_URL or cfg.SHORT_LINKS_URL:
+        await web_runner.setup()
+        await web.TCPSite(web_runner, *cfg.WEB_SERVER).start()
+        logging.info(ru.INF_WEB_STARTED.format(*cfg.WEB_SERVER))
+
+
+async def on_shutdown(_):
+    await web_runner.cleanup()
+    await http.aclose()
+    await sql_db.flush_users()
+    sql_db.sql_stop()
 
 
 reg_admin_menu_handlers(dp)
 reg_admin_shift_handlers(dp)
 reg_division_handlers(dp)
 reg_menu_handlers(dp)
+router.register(dp)
+reg_payment_routes(web_app)
 
 
 if __name__ == '__main__':
     logging.info(ru.INF_START_CONNECTION)
     try:
-        loop = get_event_loop()
-        loop.create_task(check_payment_status())
-        executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
     except Exception as exc:
         logging.error(exc)
         raise exc
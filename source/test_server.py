@@ -3,22 +3,35 @@ from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.responses import Response
 from starlette.routing import Route
+from hashlib import sha256
+from itertools import count
 import httpx
 import json
+import os
+import sys
+
+# python test_server.py notify - после перехода по платежной ссылке сервер сам отправит боту уведомление об оплате
+NOTIFY = "notify" in sys.argv[1:]
+PASSWORD = os.environ.get("TERMINAL_PASSWORD", "TinkoffBankTestPassword")
+payment_ids = count(13660)
+notifications: dict = {}
 
 
 async def init(req: Request) -> Response:
-    print(dict(await req.json()))
+    request: dict = dict(await req.json())
+    print(request)
+    payment_id: str = str(next(payment_ids))
+    notifications[payment_id] = request
     data: json = json.dumps(
         {
             "Success": "true",
             "ErrorCode": "0",
             "TerminalKey": "TinkoffBankTest",
             "Status": "NEW",
-            "PaymentId": "13660",
-            "OrderId": "21050",
+            "PaymentId": payment_id,
+            "OrderId": str(request.get("OrderId", "21050")),
             "Amount": 100000,
-            "PaymentURL": "http://localhost:8000/to_pay"
+            "PaymentURL": f"http://localhost:8000/to_pay?PaymentId={payment_id}"
         }
     )
     return Response(data, status_code=httpx.codes.OK)
@@ -31,7 +44,7 @@ async def state(req: Request) -> Response:
             "ErrorCode": "0",
             "Message": "OK",
             "TerminalKey": "TinkoffBankTest",
-            "Status": "CONFIRMED",
+            "Status": "NEW" if NOTIFY else "CONFIRMED",
             "PaymentId": "2304882",
             "OrderId": "#419",
             "Amount": "1000"
@@ -42,8 +55,24 @@ async def state(req: Request) -> Response:
 
 async def to_pay(req: Request) -> Response:
     print("Оплачено")
+    payment_id: str = req.query_params.get("PaymentId", "")
+    request: dict = notifications.pop(payment_id, {})
+    if NOTIFY and request.get("NotificationURL"):
+        notification: dict = {
+            "TerminalKey": request.get("TerminalKey"),
+            "OrderId": str(request.get("OrderId")),
+            "Success": True,
+            "Status": "CONFIRMED",
+            "PaymentId": payment_id,
+            "ErrorCode": "0",
+            "Amount": request.get("Amount"),
+            "Token": sha256(f"{PASSWORD}{payment_id}{PASSWORD}".encode("utf-8")).hexdigest(),
+        }
+        async with httpx.AsyncClient() as client:
+            answer: httpx.Response = await client.post(request["NotificationURL"], json=notification)
+        print("Уведомление:", answer.status_code, answer.text)
     data: dict = {"Status": "CONFIRMED"}
-    return Response(data, status_code=httpx.codes.OK)
+    return Response(json.dumps(data), status_code=httpx.codes.OK)
 
 
 routes = [
@@ -55,4 +84,4 @@ routes = [
 api = Starlette(routes=routes)
 
 if __name__ == '__main__':
-    uvicorn.run(app=api, debug=True, host="localhost", port=8000)
\ No newline at end of file
+    uvicorn.run(app=api, debug=True, host="localhost", port=8000)
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("TG_TOKEN", "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+os.environ.setdefault("ADMIN_IDS", "111111111")
+os.environ.setdefault("TERMINAL_KEY", "TinkoffBankTest")
+os.environ.setdefault("TERMINAL_PASSWORD", "TinkoffBankTestPassword")
+os.environ.setdefault("TINKOFF_INIT_API", "http://localhost:8000/init")
+os.environ.setdefault("TINKOFF_STATE_API", "http://localhost:8000/state")
+
+from database import sql_db  # noqa: E402 the environment must be set before the config is read
+
+# Tests never touch the bot's database: the pool opens its connections on the first request
+sql_db.pool.path = Path(tempfile.mkdtemp()) / "CafeBar.db"
+TABLES = (
+    "client",
+    "product",
+    "pre_order",
+    "payment",
+    "paid_product",
+    "shift_totals",
+    "payment_archive",
+    "paid_product_archive",
+    "short_link",
+    "outbox",
+)
+USER_ID = 123456789
+DESCRIPTION = "Description of the dish, which is long enough for the check"
+
+
+@sql_db.pool.writer
+def clear_tables() -> None:
+    """
+    Deletes all rows of the test database
+    :return: Empty tables
+    """
+    base = sql_db.pool.connection
+    with base:
+        for table in TABLES:
+            base.execute(f"DELETE FROM {table}")
+
+
+async def prepare_db() -> None:
+    """
+    Creates the test database and empties it and the caches
+    :return: Empty database
+    """
+    await sql_db.sql_start()
+    await clear_tables()
+    sql_db.menu_cache.clear()
+    sql_db.carts.clear()
+    sql_db.shift_totals.reset([])
+
+
+async def add_dish(name: str, price: float = 100.0, count: int = 10, category: str = "beer") -> None:
+    """
+    Adds the product to the menu
+    :param name: Product's name
+    :param price: Product's price
+    :param count: Product's count in stock
+    :param category: Category's slug
+    :return: Added product
+    """
+    data: dict = {"category": category, "image": "photo", "name": name, "description": DESCRIPTION}
+    await sql_db.add_product({**data, "price": price, "count": count})
+
+
+@pytest.fixture
+def db():
+    """Empty test database"""
+    asyncio.run(prepare_db())
+    return sql_db
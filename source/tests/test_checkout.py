@@ -0,0 +1,81 @@
+import asyncio
+import httpx
+
+from conftest import USER_ID, add_dish
+from handlers import payment
+
+REQUEST = httpx.Request("POST", "http://bank/init")
+
+
+def test_empty_cart(db):
+    assert asyncio.run(db.checkout(USER_ID)) == (0, 0.0)
+
+
+def test_cart_moves_into_payment(db):
+    async def main():
+        await add_dish("Beer", 150.0, 10)
+        await add_dish("Chips", 50.0, 5)
+        await db.add_product_into_cart("Beer", USER_ID, 3)
+        await db.add_product_into_cart("Chips", USER_ID, 2)
+        payment_id, amount = await db.checkout(USER_ID)
+        assert amount == 550.0
+        assert await db.get_payment(payment_id) == (USER_ID, None, 550.0, "NEW")
+        assert sorted(await db.get_paid_products(payment_id)) == [("Beer", 3), ("Chips", 2)]
+        assert (await db.get_product("Beer"))[-1] == 7
+        assert (await db.get_product("Chips"))[-1] == 3
+        assert await db.get_orders(USER_ID) == []
+        operations, _ = await db.get_due_operations(float("inf"), 10)
+        assert [operation[1:3] for operation in operations] == [("init", payment_id)]
+
+    asyncio.run(main())
+
+
+def test_second_checkout_appends_to_payment_without_link(db):
+    async def main():
+        await add_dish("Beer", 150.0, 10)
+        await db.add_product_into_cart("Beer", USER_ID, 1)
+        first, _ = await db.checkout(USER_ID)
+        await db.add_product_into_cart("Beer", USER_ID, 2)
+        second, amount = await db.checkout(USER_ID)
+        assert (second, amount) == (first, 450.0)
+        assert (await db.get_product("Beer"))[-1] == 7
+        operations, _ = await db.get_due_operations(float("inf"), 10)
+        assert len(operations) == 1
+
+    asyncio.run(main())
+
+
+def test_second_checkout_keeps_payment_with_link(db):
+    async def main():
+        await add_dish("Beer", 150.0, 10)
+        await db.add_product_into_cart("Beer", USER_ID, 1)
+        first, amount = await db.checkout(USER_ID)
+        assert await db.update_payment_id(13660, first, amount)
+        await db.add_product_into_cart("Beer", USER_ID, 2)
+        second, amount = await db.checkout(USER_ID)
+        assert second != first and amount == 300.0
+        assert (await db.get_payment(first))[1:3] == (13660, 150.0)
+        operations, _ = await db.get_due_operations(float("inf"), 10)
+        assert [operation[2] for operation in operations] == [first, second]
+
+    asyncio.run(main())
+
+
+def test_link_of_changed_order_is_cancelled(db, monkeypatch):
+    async def get_response(*args, **kwargs):
+        return httpx.Response(200, json={"PaymentURL": "http://bank/pay", "PaymentId": 13660}, request=REQUEST)
+
+    async def main():
+        await add_dish("Beer", 150.0, 10)
+        await db.add_product_into_cart("Beer", USER_ID, 1)
+        payment_id, _ = await db.checkout(USER_ID)
+        await db.add_product_into_cart("Beer", USER_ID, 2)
+        await db.checkout(USER_ID)
+        assert await payment.create_payment_url(150.0, payment_id, USER_ID) == ""
+        assert (await db.get_payment(payment_id))[1] is None
+        operations, _ = await db.get_due_operations(float("inf"), 10)
+        assert [operation[1:3] for operation in operations] == [("init", payment_id), ("cancel", 13660)]
+
+    monkeypatch.setattr(payment, "get_response", get_response)
+    monkeypatch.setattr(payment.cfg, "CANCEL_PAYMENT_API", "http://bank/cancel")
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+import asyncio
+
+from conftest import USER_ID, add_dish
+
+OTHER_USER_ID = 987654321
+
+
+def test_carts_do_not_drop_menu_cache(db):
+    async def main():
+        await add_dish("Beer", count=10)
+        await db.get_menu("beer")
+        misses: int = db.menu_cache.misses
+        await db.add_product_into_cart("Beer", USER_ID, 3)
+        await db.add_product_into_cart("Beer", OTHER_USER_ID, 2)
+        assert (await db.get_menu("beer", user_id=USER_ID))[0][4:] == (10, 2)
+        assert (await db.get_menu("beer"))[0][4:] == (10, 5)
+        await db.update_in_cart_product_count(0, "Beer", OTHER_USER_ID)
+        await db.cancel_user_orders(USER_ID)
+        assert (await db.get_menu("beer"))[0][4:] == (10, 0)
+        assert db.menu_cache.misses == misses
+
+    asyncio.run(main())
+
+
+def test_carts_mirror_database(db):
+    async def main():
+        await add_dish("Beer", count=10)
+        await db.add_product_into_cart("Beer", USER_ID, 3)
+        await db.add_product_into_cart("Beer", OTHER_USER_ID, 2)
+        await db.checkout(USER_ID)
+        assert (await db.get_menu("beer", user_id=OTHER_USER_ID))[0][4:] == (7, 0)
+        await db.sql_start()  # the mirror is loaded again from the database
+        assert db.carts.cart(OTHER_USER_ID) == {"Beer": 2}
+        assert db.carts.reserved("Beer") == (await db.get_reserved())[0][1] == 2
+
+    asyncio.run(main())
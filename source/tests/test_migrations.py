@@ -0,0 +1,42 @@
+import asyncio
+
+from database import migrations
+
+FIELDS = "id, date_time, user_id, payment_id, amount, status"
+
+
+def test_stuck_payments_become_new(db):
+    @db.pool.writer
+    def migrate_stuck_payments():
+        base = db.pool.connection
+        with base:
+            base.execute(f"INSERT INTO payment({FIELDS}) VALUES (1, 0, 123456789, 13660, 100, 'FORM_SHOWED')")
+            base.execute(f"INSERT INTO payment({FIELDS}) VALUES (2, 0, 123456789, 13661, 100, 'CONFIRMED')")
+            base.execute("INSERT INTO payment_archive VALUES (3, 0, 123456789, 13662, 100, 'AUTHORIZED')")
+            base.execute("INSERT INTO paid_product_archive VALUES (3, 'Beer', 100, 1)")
+            for step in migrations.MIGRATIONS[6]:
+                base.execute(step)
+        return (
+            base.execute("SELECT id, status FROM payment ORDER BY id").fetchall(),
+            base.execute("SELECT payment_id, product FROM paid_product").fetchall(),
+            base.execute("SELECT count(*) FROM payment_archive").fetchone()[0],
+        )
+
+    payments, products, archived = asyncio.run(migrate_stuck_payments())
+    assert payments == [(1, "NEW"), (2, "CONFIRMED"), (3, "NEW")]
+    assert products == [(3, "Beer")]
+    assert archived == 0
+
+
+def test_old_links_are_sent(db):
+    @db.pool.writer
+    def migrate_links():
+        base = db.pool.connection
+        with base:
+            base.execute(f"INSERT INTO payment({FIELDS}) VALUES (1, 0, 123456789, 13660, 100, 'NEW')")
+            base.execute(f"INSERT INTO payment({FIELDS}) VALUES (2, 0, 123456789, NULL, 100, 'NEW')")
+            base.execute("UPDATE payment SET link_sent = 0")
+            base.execute(migrations.MIGRATIONS[7][-1])
+        return base.execute("SELECT id, link_sent FROM payment ORDER BY id").fetchall()
+
+    assert asyncio.run(migrate_links()) == [(1, 1), (2, 0)]
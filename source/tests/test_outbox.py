@@ -0,0 +1,74 @@
+import asyncio
+import httpx
+
+from aiogram.utils.exceptions import NetworkError
+from asyncio import Semaphore
+
+from conftest import USER_ID, add_dish
+from handlers import outbox, payment
+
+REQUEST = httpx.Request("POST", "http://bank/init")
+
+
+def test_unsaved_operation_stays_due(monkeypatch):
+    async def init_payment(payment_id):
+        return True
+
+    async def finish_operation(operation_id, due):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setitem(outbox.OPERATIONS, "init", init_payment)
+    monkeypatch.setattr(outbox.sql_db, "finish_operation", finish_operation)
+    assert not asyncio.run(outbox.do_operation((1, "init", 1, 0, 0.0), Semaphore(1)))
+
+
+def test_outbox_survives_errors(monkeypatch):
+    calls: list = []
+
+    async def get_due_operations(now, limit):
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return [], None
+
+    async def main():
+        try:
+            await asyncio.wait_for(outbox.process_outbox(), 0.3)
+        except asyncio.TimeoutError:
+            pass
+
+    monkeypatch.setattr(outbox.sql_db, "get_due_operations", get_due_operations)
+    monkeypatch.setattr(outbox.cfg, "OUTBOX_BACKOFF", (0.1, 0.1))
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_lost_link_is_sent_again(db, monkeypatch):
+    requests: list = []
+    sent: list = []
+
+    async def get_response(*args, **kwargs):
+        requests.append(kwargs["json_data"])
+        return httpx.Response(200, json={"PaymentURL": "http://bank/pay", "PaymentId": 13660}, request=REQUEST)
+
+    async def notify(user_id, text, markup=None):
+        sent.append(markup)
+        if len(sent) == 1:
+            raise NetworkError("Connection reset")
+        return True
+
+    async def main():
+        await add_dish("Beer", 150.0, 10)
+        await db.add_product_into_cart("Beer", USER_ID, 1)
+        payment_id, _ = await db.checkout(USER_ID)
+        (operation,), _ = await db.get_due_operations(float("inf"), 10)
+        assert await outbox.do_operation(operation, Semaphore(1))
+        assert await db.get_payment_link(payment_id) == ("http://bank/pay", False)
+        assert await outbox.init_payment(payment_id)
+        assert await db.get_payment_link(payment_id) == ("http://bank/pay", True)
+        assert await outbox.init_payment(payment_id)
+
+    monkeypatch.setattr(payment, "get_response", get_response)
+    monkeypatch.setattr(outbox, "notify", notify)
+    asyncio.run(main())
+    assert len(requests) == 1 and len(sent) == 2
@@ -0,0 +1,27 @@
+from core.messanger import MESSAGE_LIMIT, pack_lines
+
+
+def test_lines_fill_messages():
+    lines: list = [f"{i:03}" + "x" * 96 for i in range(100)]
+    messages: list = list(pack_lines(lines))
+    assert len(messages) == 3
+    assert all(len(message) <= MESSAGE_LIMIT for message in messages)
+    assert "\n".join(messages) == "\n".join(lines)
+
+
+def test_exact_limit():
+    assert list(pack_lines(["a" * 4, "b" * 5], limit=10)) == ["aaaa\nbbbbb"]
+    assert list(pack_lines(["a" * 5, "b" * 5], limit=10)) == ["aaaaa", "bbbbb"]
+
+
+def test_long_line_is_cut():
+    assert list(pack_lines(["short", "x" * 25, "tail"], limit=10)) == ["short", "x" * 10, "x" * 10, "xxxxx\ntail"]
+
+
+def test_escape_is_not_cut():
+    messages: list = list(pack_lines(["a" * 9 + "\\_" + "b" * 5], limit=10))
+    assert messages == ["a" * 9, "\\_bbbbb"]
+
+
+def test_no_lines():
+    assert list(pack_lines([])) == []
@@ -0,0 +1,96 @@
+import asyncio
+import httpx
+
+from asyncio import Semaphore
+from time import time
+
+from conftest import USER_ID, add_dish
+from handlers import payment
+
+
+def test_state_of_broken_response(monkeypatch):
+    async def get_response(*args, **kwargs):
+        return httpx.Response(200, text="<html>Bad gateway</html>", request=httpx.Request("POST", "http://bank"))
+
+    monkeypatch.setattr(payment, "get_response", get_response)
+    assert asyncio.run(payment.get_payment_state((1, 13660, 1), Semaphore(1))) == ""
+
+
+def test_poller_survives_errors(db, monkeypatch):
+    calls: list = []
+
+    async def get_new_payments():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return []
+
+    async def main():
+        try:
+            await asyncio.wait_for(payment.check_payment_status(), 0.3)
+        except asyncio.TimeoutError:
+            pass
+
+    monkeypatch.setattr(payment.sql_db, "get_new_payments", get_new_payments)
+    monkeypatch.setattr(payment.cfg, "STATE_PAYMENT_INTERVALS", (0.1, 0.1, 0.1))
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_polls_till_final_status(db, monkeypatch):
+    notified: list = []
+
+    async def notify(user_id, text, markup=None):
+        notified.append(user_id)
+
+    async def main():
+        await add_dish("Beer", count=10)
+        await db.add_product_into_cart("Beer", USER_ID, 2)
+        payment_id, amount = await db.checkout(USER_ID)
+        await db.update_payment_id(13660, payment_id, amount)
+        for status in ("FORM_SHOWED", "AUTHORIZED", "CONFIRMED"):
+            monkeypatch.setattr(payment, "get_payment_state", make_state(status))
+            payment.scheduled_payments.clear()
+            await payment.poll_payments([(payment_id, 13660, USER_ID, time(), time())], Semaphore(1))
+            rescheduled: bool = payment_id in payment.scheduled_payments
+            assert (await db.get_payment(payment_id))[3] == ("CONFIRMED" if status == "CONFIRMED" else "NEW")
+            assert rescheduled == (status != "CONFIRMED")
+            new_payments: list = [] if status == "CONFIRMED" else [payment_id]
+            assert [payment[0] for payment in await db.get_new_payments()] == new_payments
+        assert notified == [USER_ID]
+
+    def make_state(status: str):
+        async def get_payment_state(*args):
+            return status
+
+        return get_payment_state
+
+    monkeypatch.setattr(payment, "notify", notify)
+    asyncio.run(main())
+
+
+def test_last_poll_asks_bank(db, monkeypatch):
+    async def notify(user_id, text, markup=None):
+        pass
+
+    async def main(status: str, bank_payment_id: int) -> tuple:
+        await add_dish(status, count=10)
+        await db.add_product_into_cart(status, USER_ID, 2)
+        payment_id, amount = await db.checkout(USER_ID)
+        await db.update_payment_id(bank_payment_id, payment_id, amount)
+        monkeypatch.setattr(payment, "get_payment_state", make_state(status))
+        created: float = time() - payment.cfg.STATE_PAYMENT_LIFETIME
+        await payment.poll_payments([(payment_id, bank_payment_id, USER_ID, created, time())], Semaphore(1))
+        assert payment_id not in payment.scheduled_payments
+        return (await db.get_payment(payment_id))[3], (await db.get_product(status))[5]
+
+    def make_state(status: str):
+        async def get_payment_state(*args):
+            return status
+
+        return get_payment_state
+
+    monkeypatch.setattr(payment, "notify", notify)
+    monkeypatch.setattr(db, "STATE_PAYMENT_LIFETIME", -1)
+    assert asyncio.run(main("CONFIRMED", 13660)) == ("CONFIRMED", 8)
+    assert asyncio.run(main("AUTHORIZED", 13661)) == ("EXPIRED", 10)
@@ -0,0 +1,90 @@
+import asyncio
+
+from types import SimpleNamespace
+
+from core.router import CallbackRouter
+
+
+class State:
+    def __init__(self, state=None):
+        self.state = state
+
+    async def get_state(self):
+        return self.state
+
+
+def make_query(data: str):
+    async def answer(*args, **kwargs):
+        query.answered = True
+
+    query = SimpleNamespace(data=data, from_user=SimpleNamespace(id=1), answered=False, answer=answer)
+    return query
+
+
+def make_router(calls: list) -> CallbackRouter:
+    async def handler(query, *args, **kwargs):
+        calls.append((query.data, args, kwargs))
+
+    async def with_state(query, payload, state):
+        calls.append((query.data, (payload,), {"state": state.state}))
+
+    router: CallbackRouter = CallbackRouter()
+    router.add("menu", handler)
+    router.add("menu_all", handler, kind="all")
+    router.add("order_add ", handler, str)
+    router.add("order_add_count ", handler, int)
+    router.add("admin_", with_state, str, state="Admin:menu")
+    return router
+
+
+def test_longest_prefix_wins():
+    router: CallbackRouter = make_router([])
+    assert router.find("menu") == (router.routes["menu"], "")
+    assert router.find("menu_all") == (router.routes["menu_all"], "")
+    assert router.find("order_add Beer") == (router.routes["order_add "], "Beer")
+    assert router.find("order_add_count 3") == (router.routes["order_add_count "], "3")
+
+
+def test_route_without_parser_matches_whole_data():
+    router: CallbackRouter = make_router([])
+    assert router.find("menu_") == (None, "menu_")
+    assert router.find("unknown") == (None, "unknown")
+
+
+def test_dispatch_passes_payload_and_kwargs():
+    calls: list = []
+    router: CallbackRouter = make_router(calls)
+    asyncio.run(router.dispatch(make_query("order_add_count 3"), State()))
+    asyncio.run(router.dispatch(make_query("menu_all"), State()))
+    assert calls == [("order_add_count 3", (3,), {}), ("menu_all", (), {"kind": "all"})]
+    assert router.stats["order_add_count "]["hits"] == 1
+    assert router.stats["menu"]["hits"] == 0
+
+
+def test_bad_payload_is_answered():
+    calls: list = []
+    router: CallbackRouter = make_router(calls)
+    query = make_query("order_add_count many")
+    asyncio.run(router.dispatch(query, State()))
+    assert query.answered and calls == []
+
+
+def test_state_filter():
+    calls: list = []
+    router: CallbackRouter = make_router(calls)
+    asyncio.run(router.dispatch(make_query("admin_Beer"), State()))
+    asyncio.run(router.dispatch(make_query("admin_Beer"), State("Admin:menu")))
+    assert calls == [("admin_Beer", ("Beer",), {"state": "Admin:menu"})]
+
+
+def test_errors_are_counted():
+    async def broken(query):
+        raise RuntimeError("broken")
+
+    router: CallbackRouter = CallbackRouter()
+    router.add("broken", broken)
+    try:
+        asyncio.run(router.dispatch(make_query("broken"), State()))
+    except RuntimeError:
+        pass
+    assert router.stats["broken"]["errors"] == 1 and router.stats["broken"]["hits"] == 1
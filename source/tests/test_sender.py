@@ -0,0 +1,77 @@
+import asyncio
+
+from aiogram.utils.exceptions import RetryAfter
+from time import monotonic
+
+from core.sender import PRIORITY_MENU, PRIORITY_PAYMENT, SendScheduler
+
+
+def make_request(sent: list, name: str):
+    async def request():
+        sent.append((name, monotonic()))
+        return name
+
+    return request
+
+
+def test_payment_overtakes_queued_menu():
+    sent: list = []
+
+    async def main():
+        scheduler: SendScheduler = SendScheduler(100, 20, 1)
+        menu: list = [scheduler.send(PRIORITY_MENU, 1, make_request(sent, f"menu {i}")) for i in range(3)]
+        await asyncio.sleep(0.01)
+        payment = scheduler.send(PRIORITY_PAYMENT, 1, make_request(sent, "payment"))
+        assert scheduler.depth == 3
+        await asyncio.gather(payment, *menu)
+        assert scheduler.depth == 0
+
+    asyncio.run(main())
+    assert [name for name, _ in sent] == ["menu 0", "payment", "menu 1", "menu 2"]
+
+
+def test_global_token_goes_to_urgent_chat():
+    sent: list = []
+
+    async def main():
+        scheduler: SendScheduler = SendScheduler(20, 100, 100)
+        menu: list = [scheduler.send(PRIORITY_MENU, 1, make_request(sent, "menu")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        await asyncio.gather(scheduler.send(PRIORITY_PAYMENT, 2, make_request(sent, "payment")), *menu)
+
+    asyncio.run(main())
+    assert [name for name, _ in sent].index("payment") <= 2
+
+
+def test_global_rate_is_kept():
+    sent: list = []
+    rate: int = 20
+
+    async def main():
+        scheduler: SendScheduler = SendScheduler(rate, 100, 100)
+        await asyncio.gather(
+            *(scheduler.send(PRIORITY_MENU, chat_id, make_request(sent, "menu")) for chat_id in range(10) for _ in "ab")
+        )
+
+    asyncio.run(main())
+    times: list = [time for _, time in sent]
+    assert len(times) == 20
+    assert min(later - earlier for earlier, later in zip(times, times[1:])) >= 0.9 / rate
+
+
+def test_send_is_repeated_after_retry_after():
+    calls: list = []
+
+    async def request():
+        calls.append(monotonic())
+        if len(calls) == 1:
+            raise RetryAfter(1)
+        return "sent"
+
+    async def main():
+        scheduler: SendScheduler = SendScheduler(100, 100, 1)
+        assert await scheduler.send(PRIORITY_PAYMENT, 1, request) == "sent"
+        assert scheduler.stats["retries"] == 1
+
+    asyncio.run(main())
+    assert calls[1] - calls[0] >= 0.9
@@ -0,0 +1,145 @@
+import asyncio
+
+from conftest import USER_ID, add_dish
+from handlers import payment
+
+
+def make_payment(db) -> int:
+    async def main() -> int:
+        await add_dish("Beer", count=10)
+        await db.add_product_into_cart("Beer", USER_ID, 2)
+        payment_id, _ = await db.checkout(USER_ID)
+        return payment_id
+
+    return asyncio.run(main())
+
+
+def mute(monkeypatch) -> list:
+    notified: list = []
+
+    async def notify(user_id, text, markup=None):
+        notified.append(text)
+
+    monkeypatch.setattr(payment, "notify", notify)
+    return notified
+
+
+def expire(db, monkeypatch, payment_id: int) -> None:
+    monkeypatch.setattr(db, "STATE_PAYMENT_LIFETIME", -1)
+    asyncio.run(payment.return_to_stock(asyncio.run(db.expire_old_payments([payment_id]))))
+
+
+def stock(db) -> int:
+    return asyncio.run(db.get_product("Beer"))[5]
+
+
+def status(db, payment_id: int) -> str:
+    return asyncio.run(db.get_payment(payment_id))[3]
+
+
+def test_repeated_status_changes_nothing(db, monkeypatch):
+    notified: list = mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    assert asyncio.run(payment.apply_statuses([("REJECTED", payment_id)])) == 1
+    assert asyncio.run(payment.apply_statuses([("REJECTED", payment_id)])) == 0
+    assert stock(db) == 10
+    assert len(notified) == 1
+
+
+def test_rejection_after_expiry_does_not_restock(db, monkeypatch):
+    notified: list = mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    expire(db, monkeypatch, payment_id)
+    assert stock(db) == 10
+    assert asyncio.run(payment.apply_statuses([("REJECTED", payment_id)])) == 0
+    assert status(db, payment_id) == "EXPIRED"
+    assert stock(db) == 10
+    assert notified == []
+
+
+def test_late_confirmation_takes_stock(db, monkeypatch):
+    notified: list = mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    expire(db, monkeypatch, payment_id)
+    assert asyncio.run(payment.apply_statuses([("CONFIRMED", payment_id)])) == 1
+    assert status(db, payment_id) == "CONFIRMED"
+    assert stock(db) == 8
+    assert db.shift_totals.rows() == [("Beer", 2, 200.0)]
+    assert len(notified) == 1
+
+
+def test_cancelled_payment_returns_to_stock_once(db, monkeypatch):
+    mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    assert asyncio.run(payment.apply_statuses([("CANCELED", payment_id)])) == 1
+    assert asyncio.run(payment.apply_statuses([("REVERSED", payment_id)])) == 0
+    assert stock(db) == 10
+
+
+def test_stale_status_after_confirmation(db, monkeypatch):
+    mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    asyncio.run(payment.apply_statuses([("CONFIRMED", payment_id)]))
+    assert asyncio.run(db.change_payment_statuses([("AUTHORIZED", payment_id), ("REJECTED", payment_id)])) == []
+    assert status(db, payment_id) == "CONFIRMED"
+    assert db.shift_totals.rows() == [("Beer", 2, 200.0)]
+    assert stock(db) == 8
+
+
+def test_refund_subtracts_totals(db, monkeypatch):
+    mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    asyncio.run(payment.apply_statuses([("CONFIRMED", payment_id)]))
+    assert asyncio.run(payment.apply_statuses([("REFUNDED", payment_id)])) == 1
+    assert status(db, payment_id) == "REFUNDED"
+    assert db.shift_totals.rows() == []
+
+
+def test_shift_keeps_payments_in_progress(db, monkeypatch):
+    mute(monkeypatch)
+    other_id: int = make_payment(db)
+    asyncio.run(payment.apply_statuses([("CONFIRMED", other_id)]))
+    asyncio.run(db.add_product_into_cart("Beer", USER_ID, 1))
+    payment_id, _ = asyncio.run(db.checkout(USER_ID))
+    assert asyncio.run(db.archive_shift()) == 1
+    assert status(db, payment_id) == "NEW"
+    assert asyncio.run(db.get_payment(other_id)) == ()
+    assert asyncio.run(db.get_payment_status(other_id)) == "CONFIRMED"
+
+
+def test_archived_payment_is_changed(db, monkeypatch):
+    notified: list = mute(monkeypatch)
+    payment_id: int = make_payment(db)
+    asyncio.run(db.update_payment_id(13660, payment_id, 200.0))
+    expire(db, monkeypatch, payment_id)
+    asyncio.run(db.archive_shift())
+    assert asyncio.run(db.find_payment(13660)) == payment_id
+    assert asyncio.run(payment.apply_statuses([("CONFIRMED", payment_id)])) == 1
+    assert asyncio.run(db.get_payment_status(payment_id)) == "CONFIRMED"
+    assert stock(db) == 8
+    assert db.shift_totals.rows() == []
+    assert len(notified) == 1
+
+
+def test_failed_notification_stops_nothing(db, monkeypatch):
+    notified: list = []
+
+    async def notify(user_id, text, markup=None):
+        if not notified:
+            notified.append(None)
+            raise asyncio.TimeoutError()
+        notified.append(text)
+
+    async def main():
+        await add_dish("Beer", count=10)
+        payments: list = []
+        for _ in range(2):
+            await db.add_product_into_cart("Beer", USER_ID, 2)
+            payments.append((await db.checkout(USER_ID))[0])
+            await db.update_payment_id(13660 + len(payments), payments[-1], 200.0)
+        assert await payment.apply_statuses([("REJECTED", payment_id) for payment_id in payments]) == 2
+
+    monkeypatch.setattr(payment, "notify", notify)
+    asyncio.run(main())
+    assert stock(db) == 10
+    assert len(notified) == 2